@@ -0,0 +1,95 @@
+"""
+Measures download throughput of download_and_verify_package for a range of chunk sizes against a
+local HTTP server, so that the default chunk size can be checked on a given machine.
+
+Usage:
+    python benchmarks/bench_chunk_size.py [--size MB] [--repeat N] [--chunk-sizes KB [KB ...]]
+"""
+
+import argparse
+import functools
+import hashlib
+import http.server
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rootbeer  # noqa: E402
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    Serves files from a directory without logging every request to stderr.
+    """
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command-line arguments of the benchmark.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark download throughput against the chunk size")
+    parser.add_argument("--size", type=int, default=256, metavar="MB", help="Size of the served file (default: 256)")
+    parser.add_argument("--repeat", type=int, default=3, metavar="N", help="Downloads per chunk size (default: 3)")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[8, 64, 256, 1024, 4096], metavar="KB",
+                        help="Chunk sizes to measure (default: 8 64 256 1024 4096)")
+    return parser.parse_args()
+
+
+def main() -> None:
+    """
+    Serves a file of random data from a temporary directory and downloads it repeatedly with each chunk
+    size, printing the best throughput observed for each.
+    """
+    args = parse_arguments()
+    logger = logging.getLogger("bench_chunk_size")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    with tempfile.TemporaryDirectory() as serve_dir, tempfile.TemporaryDirectory() as cache_dir:
+        served_file = os.path.join(serve_dir, "artifact.bin")
+        file_hash = hashlib.sha256()
+        with open(served_file, "wb") as file:
+            for _ in range(args.size):
+                block = os.urandom(1024 ** 2)
+                file_hash.update(block)
+                file.write(block)
+
+        handler = functools.partial(QuietHandler, directory=serve_dir)
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        rootbeer.settings.cache_dir = cache_dir
+        rootbeer.settings.artifact_cache_size = 0
+        package = rootbeer.Package(name="artifact", version="0", strategy="vendor_install",
+                                   location=f"http://127.0.0.1:{server.server_port}/artifact.bin",
+                                   checksum=file_hash.hexdigest(), installer_type="exe")
+
+        print(f"{'chunk size':>12} {'best time':>10} {'throughput':>14}")
+        try:
+            for chunk_size in args.chunk_sizes:
+                rootbeer.settings.chunk_size = chunk_size * 1024
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    package_file = rootbeer.download_and_verify_package(package, logger)
+                    timings.append(time.perf_counter() - start)
+                    os.remove(package_file)
+                best = min(timings)
+                print(f"{chunk_size:>9} KB {best:>9.3f}s {args.size / best:>9.1f} MB/s")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Measures the startup cost of rootbeer.py with -X importtime and wall-clock timings of fresh
+interpreters, and checks it against budgets, so that imports creeping back onto the startup path are
+noticed. Three invocations are measured, each relative to an interpreter that imports nothing:
+
+    import     importing the module, as every invocation does
+    help       rootbeer.py --help
+    cache-hit  resolving a recipe from a warm recipe cache and checking its artifact out of the artifact
+               cache, which is what a re-run with nothing to download does before its install scripts
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat N] [--top N] [--budget-import MS] [--budget-help MS]
+                                       [--budget-cache-hit MS]
+
+The exit status is 1 if any invocation exceeds its budget.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+import rootbeer  # noqa: E402
+
+cache_hit_code = """
+import logging, os, sys
+sys.path.insert(0, {repo_dir!r})
+import rootbeer
+rootbeer.settings.cache_dir = {cache_dir!r}
+rootbeer.settings.recipe_ttl = 3600
+rootbeer.settings.use_recipe_index = False
+package = rootbeer.fetch_and_parse_recipe("bench")
+plan = rootbeer.resolve_install_plan({{package.name: package}})
+os.remove(rootbeer.download_artifact(package, logging.getLogger("bench")))
+"""
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command-line arguments of the benchmark.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of rootbeer.py")
+    parser.add_argument("--repeat", type=int, default=10, metavar="N", help="Runs per invocation (default: 10)")
+    parser.add_argument("--top", type=int, default=8, metavar="N",
+                        help="Slowest imports to list per invocation (default: 8)")
+    parser.add_argument("--budget-import", type=float, default=30, metavar="MS",
+                        help="Budget for importing the module (default: 30)")
+    parser.add_argument("--budget-help", type=float, default=50, metavar="MS",
+                        help="Budget for rootbeer.py --help (default: 50)")
+    parser.add_argument("--budget-cache-hit", type=float, default=60, metavar="MS",
+                        help="Budget for a cache-hit resolution (default: 60)")
+    return parser.parse_args()
+
+
+def prepare_cache(cache_dir: str) -> None:
+    """
+    Fills a cache directory with a recipe named "bench" and its artifact, so that resolving and
+    downloading it needs no network access.
+
+    Arguments:
+        cache_dir (str): The cache directory to fill.
+    """
+    rootbeer.settings.cache_dir = cache_dir
+    artifact = os.path.join(cache_dir, "artifact.bin")
+    with open(artifact, "wb") as file:
+        file.write(os.urandom(1024))
+    with open(artifact, "rb") as file:
+        checksum = hashlib.sha256(file.read()).hexdigest()
+    rootbeer.store_cached_artifact(checksum, artifact)
+    os.remove(artifact)
+
+    recipe = {"name": "bench", "version": "1", "strategy": "vendor_install", "installer_type": "exe",
+              "location": "https://example.invalid/bench.exe", "checksum": checksum}
+    recipe_file = os.path.join(cache_dir, "recipes", rootbeer.repo_owner, rootbeer.repo_name, rootbeer.branch,
+                               "bench.json")
+    rootbeer.write_json_file(recipe_file, {"content": json.dumps(recipe), "etag": None, "last_modified": None,
+                                           "fetched_at": time.time()})
+
+
+def measure(command: list, repeat: int) -> float:
+    """
+    Runs a command in a fresh interpreter several times and returns the fastest run.
+
+    Arguments:
+        command (list): The interpreter arguments.
+        repeat (int): The number of runs.
+
+    Returns:
+        float: The fastest run in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def slowest_imports(command: list, top: int) -> list:
+    """
+    Runs a command with -X importtime and returns its slowest top-level imports, leaving out the ones
+    every interpreter makes at startup.
+
+    Arguments:
+        command (list): The interpreter arguments.
+        top (int): The number of imports to return.
+
+    Returns:
+        list: (cumulative milliseconds, module name) pairs, slowest first.
+    """
+    startup_modules = {module for _, module in top_level_imports(["-c", "pass"])}
+    imports = [(cumulative, module) for cumulative, module in top_level_imports(command)
+               if module not in startup_modules]
+    return sorted(imports, reverse=True)[:top]
+
+
+def top_level_imports(command: list) -> list:
+    """
+    Runs a command with -X importtime and returns the imports it made itself, not counting the modules
+    imported by the modules it imports.
+
+    Arguments:
+        command (list): The interpreter arguments.
+
+    Returns:
+        list: (cumulative milliseconds, module name) pairs, in import order.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime"] + command, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2]
+        if name.startswith(" ") and not name.startswith("  "):
+            imports.append((int(fields[1]) / 1000, name.strip()))
+    return imports
+
+
+def main() -> None:
+    """
+    Measures each invocation, prints its time over the bare interpreter with its slowest imports, and
+    exits with status 1 if any invocation is over budget.
+    """
+    args = parse_arguments()
+    script = os.path.join(repo_dir, "rootbeer.py")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        prepare_cache(cache_dir)
+        invocations = [
+            ("import", ["-c", f"import sys; sys.path.insert(0, {repo_dir!r}); import rootbeer"], args.budget_import),
+            ("help", [script, "--help"], args.budget_help),
+            ("cache-hit", ["-c", cache_hit_code.format(repo_dir=repo_dir, cache_dir=cache_dir)], args.budget_cache_hit),
+        ]
+        baseline = measure(["-c", "pass"], args.repeat)
+        print(f"interpreter baseline: {baseline:.1f} ms")
+
+        over_budget = False
+        for name, command, budget in invocations:
+            elapsed = measure(command, args.repeat) - baseline
+            status = "ok" if elapsed <= budget else "OVER BUDGET"
+            over_budget = over_budget or elapsed > budget
+            print(f"\n{name:<10} {elapsed:>7.1f} ms (budget {budget:.0f} ms) {status}")
+            for cumulative, module in slowest_imports(command, args.top):
+                print(f"    {cumulative:>7.1f} ms  {module}")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
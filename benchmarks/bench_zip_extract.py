@@ -0,0 +1,101 @@
+"""
+Compares ZipFile.extractall with the parallel extract_zip on a synthetic archive of many small files,
+which is the shape of most application packages.
+
+Usage:
+    python benchmarks/bench_zip_extract.py [--files N] [--file-size KB] [--repeat N] [--workers N [N ...]]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rootbeer  # noqa: E402
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command-line arguments of the benchmark.
+
+    Returns:
+        argparse.Namespace: An object containing the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark zip extraction against the number of workers")
+    parser.add_argument("--files", type=int, default=5000, metavar="N", help="Files in the archive (default: 5000)")
+    parser.add_argument("--file-size", type=int, default=16, metavar="KB", help="Size of each file (default: 16)")
+    parser.add_argument("--repeat", type=int, default=3, metavar="N", help="Extractions per variant (default: 3)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], metavar="N",
+                        help="Worker counts to measure (default: 1 2 4 8)")
+    return parser.parse_args()
+
+
+def build_archive(archive_path: str, files: int, file_size: int) -> None:
+    """
+    Writes a deflated zip archive of half-compressible files spread over nested directories.
+
+    Arguments:
+        archive_path (str): The path to write the archive to.
+        files (int): The number of files in the archive.
+        file_size (int): The size of each file in bytes.
+    """
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for index in range(files):
+            data = os.urandom(file_size // 2) + bytes(file_size - file_size // 2)
+            archive.writestr(f"app/dir{index % 50}/sub{index % 7}/file{index}.dat", data)
+
+
+def best_time(extract, archive_path: str, work_dir: str, repeat: int) -> float:
+    """
+    Runs an extraction function several times into a fresh directory and returns the fastest run.
+
+    Arguments:
+        extract (Callable): A function taking the archive path and the target directory.
+        archive_path (str): The path to the archive.
+        work_dir (str): A scratch directory to extract into.
+        repeat (int): The number of runs.
+
+    Returns:
+        float: The fastest run in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        target = os.path.join(work_dir, "out")
+        start = time.perf_counter()
+        extract(archive_path, target)
+        timings.append(time.perf_counter() - start)
+        shutil.rmtree(target)
+    return min(timings)
+
+
+def main() -> None:
+    """
+    Builds the archive once and prints the best extraction time of extractall and of extract_zip for
+    each worker count.
+    """
+    args = parse_arguments()
+
+    def extractall(archive_path: str, target: str) -> None:
+        with zipfile.ZipFile(archive_path) as archive:
+            archive.extractall(target)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        archive_path = os.path.join(work_dir, "package.zip")
+        build_archive(archive_path, args.files, args.file_size * 1024)
+
+        baseline = best_time(extractall, archive_path, work_dir, args.repeat)
+        print(f"{'variant':>16} {'best time':>10} {'speedup':>8}")
+        print(f"{'extractall':>16} {baseline:>9.3f}s {1:>7.2f}x")
+        for workers in args.workers:
+            elapsed = best_time(lambda path, target: rootbeer.extract_zip(path, target, workers),
+                                archive_path, work_dir, args.repeat)
+            print(f"{f'extract_zip x{workers}':>16} {elapsed:>9.3f}s {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,118 @@
+from __future__ import annotations
+
 import argparse
-import hashlib
+import contextlib
+import importlib
+import io
 import json
+import logging
 import os
 import shutil
-import subprocess
 import sys
-import tempfile
+import threading
+import time
+import weakref
+import dataclasses
 from dataclasses import dataclass, field
-from datetime import datetime
-from pathlib import Path
-from typing import List, Optional
-import requests
-import logging
-from colorlog import ColoredFormatter
-import platform
-import zipfile
-import tarfile
-import logging.handlers
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+# Heavier modules are imported by the functions that use them, so that the command line starts quickly
+if TYPE_CHECKING:
+    import asyncio
+    import hashlib
+    import tarfile
+
+    import aiohttp
+    import requests
 
 user_path = os.path.expanduser("~")
-print(user_path)
-if platform.system() == "Windows":
+if sys.platform == "win32":
     system_path = "C:\\Program Files"
     system_path_x86 = "C:\\Program Files (x86)"
 else:
     system_path = "/Applications"
     system_path_x86 = None
 
+repo_owner = "MuhammadButt1995"
+repo_name = "recipes"
+branch = "master"  # or the branch you want to use
+recipe_index_name = "index.json"
+mirror_artifacts_name = "artifacts.json"
+
+
+def optional_import(module_name: str):
+    """
+    Imports an optional dependency when it is first needed.
+
+    Arguments:
+        module_name (str): The name of the module.
+
+    Returns:
+        The module, or None if it is not installed.
+    """
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+@dataclass
+class Settings:
+    """
+    The Settings dataclass holds the options that apply to a whole run of the package manager.
+    main fills the module-level `settings` instance from the command-line arguments before any
+    package is processed.
+
+    Attributes:
+        cache_dir (str): The directory where downloaded recipes are cached between runs.
+        recipe_ttl (Optional[float]): The number of seconds a cached recipe is used without contacting
+            the repository. None revalidates the cached recipe on every run.
+        artifact_cache_size (int): The maximum total size in bytes of the downloaded artifacts kept in
+            the cache. The least recently used artifacts are evicted beyond it; 0 disables the cache.
+        download_segments (int): The number of parallel connections used to download a package from
+            servers that support byte ranges. 1 downloads every package as a single stream.
+        http_pool_size (int): The maximum number of pooled keep-alive connections per host.
+        http_retries (int): The number of times a failed HTTP request is retried.
+        http_backoff (float): The backoff factor in seconds between retries, doubled after each retry.
+        chunk_size (int): The size in bytes of the chunks downloads are read and written in, unless the
+            recipe sets its own chunk_size.
+        use_recipe_index (bool): Whether recipes are looked up in the consolidated recipe index before
+            being fetched individually.
+        extract_workers (int): The number of threads zip archives are extracted and "cp" packages are
+            copied with.
+        state_db (str): The SQLite database recording the installed packages.
+        force (bool): Whether packages are installed even if the same version of the same recipe is
+            recorded as installed in the state database.
+        mirror (Optional[str]): A local directory or HTTP(S) URL of a mirror populated by the mirror
+            action, used instead of the recipe repository and the upstream package locations.
+    """
+
+    cache_dir: str = os.path.join(user_path, ".rootbeer", "cache")
+    recipe_ttl: Optional[float] = None
+    artifact_cache_size: int = 5 * 1024 ** 3
+    download_segments: int = 1
+    http_pool_size: int = 10
+    http_retries: int = 3
+    http_backoff: float = 0.5
+    chunk_size: int = 1024 ** 2
+    use_recipe_index: bool = True
+    extract_workers: int = min(8, os.cpu_count() or 1)
+    state_db: str = os.path.join(user_path, ".rootbeer", "state.db")
+    force: bool = False
+    mirror: Optional[str] = None
+
+
+settings = Settings()
+session: Optional[requests.Session] = None
+session_lock = threading.Lock()
+download_locks: Dict[str, threading.Lock] = {}
+async_download_locks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+recipe_index: Optional[Dict[str, dict]] = None
+recipe_index_loaded = False
+recipe_index_lock = threading.Lock()
+mirror_artifacts: Optional[Dict[str, str]] = None
+mirror_artifacts_lock = threading.Lock()
+
 
 @dataclass
 class Package:
@@ -49,6 +135,20 @@ class Package:
         pre_uninstall (Optional[str]): A script to run before the uninstallation.
         uninstall (str): The uninstallation script.
         post_uninstall (Optional[str]): A script to run after the uninstallation.
+        chunk_size (Optional[int]): The size in bytes of the chunks the package is downloaded in,
+            overriding settings.chunk_size for this package.
+        installer_member (Optional[str]): The path or glob pattern of the archive members a zip_install
+            package needs. Only the matching members are extracted; the whole archive if None.
+        copy_source (Optional[str]): For "cp" packages, the file or directory to install, relative to the
+            downloaded package. The downloaded package itself if None.
+        copy_destination (Optional[str]): For "cp" packages, where copy_source is installed to, see
+            copy_install. The install script is run instead if None.
+        extract (Optional[bool]): Whether a vendor_install package is extracted before it is installed.
+            If None, it is extracted if its file name or response headers name an archive format, see
+            archive_suffix.
+        recipe (dict): The recipe data as fetched, set by fetch_and_parse_recipe, see recipe_data.
+        recipe_name (Optional[str]): The name the recipe was fetched under, set by fetch_and_parse_recipe,
+            which keys the package in install plans and the state database and may differ from name.
     """
 
     name: str
@@ -65,6 +165,13 @@ class Package:
     pre_uninstall: Optional[str] = None
     uninstall: str = None
     post_uninstall: Optional[str] = None
+    chunk_size: Optional[int] = None
+    installer_member: Optional[str] = None
+    copy_source: Optional[str] = None
+    copy_destination: Optional[str] = None
+    extract: Optional[bool] = None
+    recipe: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+    recipe_name: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
 def configure_logger(package_name: str) -> logging.Logger:
     """
@@ -78,6 +185,8 @@ def configure_logger(package_name: str) -> logging.Logger:
     Returns:
         logging.Logger: The configured logger object.
     """
+    from colorlog import ColoredFormatter
+    from datetime import datetime
 
     log_format = "%(log_color)s%(levelname)-8s%(reset)s %(message)s"
     log_datefmt = "%Y-%m-%d %H:%M:%S"
@@ -105,16 +214,239 @@ def configure_logger(package_name: str) -> logging.Logger:
 
 def parse_arguments() -> argparse.Namespace:
     """
-    Parses command-line arguments for the package manager. It expects the package name and an action
-    to be performed (install or uninstall).
+    Parses command-line arguments for the package manager. It expects the names of one or more packages,
+    given directly or through manifest files, and an action to be performed (install or uninstall).
+    The sync action takes the complete desired set of packages, and the upgrade action takes --all instead
+    of package names to upgrade every installed package. The index action takes no package names and
+    the mirror action mirrors every package if none are given. Options may be given anywhere, including
+    between the package names and the action.
 
     Returns:
         argparse.Namespace: An object containing the parsed arguments.
     """
     parser = argparse.ArgumentParser(description="Cross-platform software package manager")
-    parser.add_argument("package_name", help="The name of the package")
-    parser.add_argument("action", choices=["install", "uninstall"], help="Action to perform: install or uninstall")
-    return parser.parse_args()
+    parser.add_argument("package_names", nargs="*", metavar="package_name", help="The names of the packages")
+    parser.add_argument("action", choices=["install", "uninstall", "upgrade", "sync", "index", "mirror"],
+                        help="Action to perform: install, uninstall or upgrade the packages, make the packages "
+                             "the installed set (sync), build the recipe index, or copy the packages (all "
+                             "indexed packages if none are given) into a mirror")
+    parser.add_argument("-m", "--manifest", action="append", default=[], metavar="FILE",
+                        help="JSON file listing packages to process in addition to the ones given directly")
+    parser.add_argument("--recipes-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Directory of the recipe files the index action builds index.json from "
+                             "(default: the directory of this script)")
+    parser.add_argument("--check", action="store_true",
+                        help="With the index action, only check that index.json is up to date with the recipe "
+                             "files, exiting with status 1 if it is not")
+    parser.add_argument("--mirror", metavar="DIR_OR_URL",
+                        help="Fetch recipes and packages from a mirror populated by the mirror action")
+    parser.add_argument("--mirror-dest", metavar="DIR", help="Directory the mirror action populates")
+    parser.add_argument("--no-index", dest="use_recipe_index", action="store_false",
+                        help="Fetch every recipe on its own instead of looking it up in the recipe index")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Maximum number of packages to install or uninstall concurrently (default: 1)")
+    parser.add_argument("--cache-dir", default=settings.cache_dir,
+                        help=f"Directory used to cache recipes between runs (default: {settings.cache_dir})")
+    parser.add_argument("--recipe-ttl", type=float, default=None, metavar="SECONDS",
+                        help="Reuse cached recipes younger than SECONDS without contacting the repository "
+                             "('inf' never contacts it once a recipe is cached)")
+    parser.add_argument("--artifact-cache-size", type=int, default=settings.artifact_cache_size // 1024 ** 2,
+                        metavar="MB", help="Maximum size of the downloaded artifact cache in MB, 0 disables it "
+                                           f"(default: {settings.artifact_cache_size // 1024 ** 2})")
+    parser.add_argument("--segments", type=int, default=settings.download_segments, metavar="N",
+                        help="Download packages over N parallel connections when the server supports byte ranges "
+                             f"(default: {settings.download_segments})")
+    parser.add_argument("--pool-size", type=int, default=settings.http_pool_size, metavar="N",
+                        help=f"Maximum number of keep-alive connections per host (default: {settings.http_pool_size})")
+    parser.add_argument("--retries", type=int, default=settings.http_retries, metavar="N",
+                        help=f"Number of times a failed HTTP request is retried (default: {settings.http_retries})")
+    parser.add_argument("--retry-backoff", type=float, default=settings.http_backoff, metavar="SECONDS",
+                        help=f"Backoff factor between HTTP retries (default: {settings.http_backoff})")
+    parser.add_argument("--chunk-size", type=int, default=settings.chunk_size // 1024, metavar="KB",
+                        help=f"Size of the chunks downloads are read and written in (default: {settings.chunk_size // 1024})")
+    parser.add_argument("--extract-jobs", type=int, default=settings.extract_workers, metavar="N",
+                        help=f"Number of threads archives are extracted and files are copied with "
+                             f"(default: {settings.extract_workers})")
+    parser.add_argument("--state-db", default=settings.state_db, metavar="PATH",
+                        help=f"SQLite database recording the installed packages (default: {settings.state_db})")
+    parser.add_argument("--all", dest="upgrade_all", action="store_true",
+                        help="Upgrade every installed package whose recipe has a new version")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Uninstall the installed packages that depend on the packages as well")
+    parser.add_argument("--force", action="store_true",
+                        help="Install packages even if the same version of their recipe is already installed")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Install packages concurrently on an asyncio event loop instead of a thread pool "
+                             "(install action only)")
+    args = parser.parse_intermixed_args()
+    if args.action in ("install", "uninstall", "sync") and not args.package_names and not args.manifest:
+        parser.error("at least one package name or --manifest is required")
+    if args.action == "upgrade" and not args.package_names and not args.manifest and not args.upgrade_all:
+        parser.error("the upgrade action requires package names, --manifest or --all")
+    if args.upgrade_all and args.action != "upgrade":
+        parser.error("--all only applies to the upgrade action")
+    if args.use_async and args.action != "install":
+        parser.error("--async only applies to the install action")
+    if args.check and args.action != "index":
+        parser.error("--check only applies to the index action")
+    if args.action == "mirror" and not args.mirror_dest:
+        parser.error("the mirror action requires --mirror-dest")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.segments < 1:
+        parser.error("--segments must be at least 1")
+    if args.pool_size < 1:
+        parser.error("--pool-size must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.extract_jobs < 1:
+        parser.error("--extract-jobs must be at least 1")
+    return args
+
+
+def write_json_file(path: str, data) -> None:
+    """
+    Writes data as JSON to the given path atomically, so that concurrent readers never observe a
+    partially written file. Missing parent directories are created.
+
+    Arguments:
+        path (str): The path of the JSON file.
+        data: The JSON-serializable data to write.
+    """
+    import tempfile
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode="w", dir=os.path.dirname(path), suffix=".tmp", delete=False) as temp_file:
+        json.dump(data, temp_file)
+    os.replace(temp_file.name, path)
+
+
+def read_json_file(path: str) -> Optional[dict]:
+    """
+    Reads a JSON file written by write_json_file.
+
+    Arguments:
+        path (str): The path of the JSON file.
+
+    Returns:
+        Optional[dict]: The parsed data, or None if the file does not exist or is not valid JSON.
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the HTTP session shared by every recipe and artifact request of the run, creating it on
+    first use. The session keeps connections alive in a pool sized by settings.http_pool_size, so that
+    consecutive requests to the same host reuse one TCP and TLS connection, and retries failed
+    requests with exponential backoff as configured by settings.http_retries and settings.http_backoff.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    global session
+    with session_lock:
+        if session is None:
+            retry = Retry(total=settings.http_retries, backoff_factor=settings.http_backoff,
+                          status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET", "HEAD"],
+                          raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=settings.http_pool_size, pool_maxsize=settings.http_pool_size,
+                                  max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        return session
+
+
+def fetch_repository_file(file_path: str) -> Optional[str]:
+    """
+    Fetches a file from the remote GitHub recipe repository, or from the recipes directory of the
+    mirror when settings.mirror is set.
+
+    Files are cached on disk together with their ETag and Last-Modified headers. A cached file is
+    revalidated with a conditional request and reused when the repository answers 304 Not Modified;
+    while it is younger than settings.recipe_ttl it is reused without contacting the repository at all.
+
+    Arguments:
+        file_path (str): The path of the file in the repository.
+
+    Returns:
+        Optional[str]: The content of the file, or None if it could not be fetched.
+    """
+    import hashlib
+
+    if settings.mirror and not is_url(settings.mirror):
+        try:
+            with open(os.path.join(settings.mirror, "recipes", file_path)) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    if settings.mirror:
+        url = f"{settings.mirror.rstrip('/')}/recipes/{file_path}"
+        mirror_key = hashlib.sha256(settings.mirror.encode()).hexdigest()[:16]
+        cache_file = os.path.join(settings.cache_dir, "recipes", "mirrors", mirror_key, file_path)
+    else:
+        url = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{branch}/{file_path}"
+        cache_file = os.path.join(settings.cache_dir, "recipes", repo_owner, repo_name, branch, file_path)
+    cached = read_json_file(cache_file)
+    if cached and cached.get("content") is None:
+        cached = None
+
+    if cached and settings.recipe_ttl is not None and time.time() - cached["fetched_at"] < settings.recipe_ttl:
+        return cached["content"]
+
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    response = get_session().get(url, headers=headers)
+
+    if response.status_code == 304 and cached:
+        content = cached["content"]
+    elif response.status_code == 200:
+        content = response.text
+    else:
+        return None
+
+    write_json_file(cache_file, {
+        "content": content,
+        "etag": response.headers.get("ETag") or (cached or {}).get("etag"),
+        "last_modified": response.headers.get("Last-Modified") or (cached or {}).get("last_modified"),
+        "fetched_at": time.time(),
+    })
+    return content
+
+
+def load_recipe_index() -> Optional[Dict[str, dict]]:
+    """
+    Fetches the consolidated recipe index of the repository, once per run, so that resolving many
+    packages costs a single request instead of one per recipe. See build_recipe_index for its format.
+
+    Returns:
+        Optional[Dict[str, dict]]: The recipe data keyed by package name, or None if the index is
+        disabled by settings.use_recipe_index or not available in the repository.
+    """
+    global recipe_index, recipe_index_loaded
+    if not settings.use_recipe_index:
+        return None
+
+    with recipe_index_lock:
+        if not recipe_index_loaded:
+            index_json = fetch_repository_file(recipe_index_name)
+            if index_json is not None:
+                recipe_index = json.loads(index_json)["recipes"]
+            recipe_index_loaded = True
+        return recipe_index
 
 
 def fetch_and_parse_recipe(package_name: str) -> Package:
@@ -122,275 +454,2857 @@ def fetch_and_parse_recipe(package_name: str) -> Package:
     Fetches the JSON recipe file for the specified package name from the remote GitHub repository,
     parses the JSON data, and creates a Package object.
 
+    The recipe is taken from the recipe index when the index lists it, and otherwise fetched on its
+    own. Both go through the on-disk cache of fetch_repository_file. The index must be rebuilt whenever
+    a recipe changes, which the index action with --check verifies, see recipe_index_is_current.
+
     Arguments:
         package_name (str): The name of the package for which the recipe file should be fetched.
 
     Returns:
         Package: An instance of the Package dataclass containing the parsed recipe data.
     """
-    repo_owner = "MuhammadButt1995"
-    repo_name = "recipes"
-    branch = "master"  # or the branch you want to use
-    file_path = f"{package_name}.json"
-
-    url = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{branch}/{file_path}"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        raise ValueError(f"Failed to fetch the recipe file for package '{package_name}'")
+    index = load_recipe_index()
+    if index is not None and package_name in index:
+        package_data = index[package_name]
+    else:
+        recipe_json = fetch_repository_file(f"{package_name}.json")
+        if recipe_json is None:
+            raise ValueError(f"Failed to fetch the recipe file for package '{package_name}'")
+        package_data = json.loads(recipe_json)
 
-    recipe_json = response.text
-    package_data = json.loads(recipe_json)
     package = Package(**package_data)
+    package.recipe = package_data
+    package.recipe_name = package_name
 
     return package
 
-def install_package(package: Package, logger: logging.Logger):
+
+def build_recipe_index(recipes_dir: str) -> dict:
     """
-    Installs the specified package by following the installation strategy defined in the Package object.
-    Handles installation of package dependencies as well.
+    Builds the consolidated recipe index from the recipe files in a directory. The index is a JSON object
+    with a "version" stamp, derived from the content of the recipes, and a "recipes" object mapping each
+    package name to its recipe data. JSON files that are not recipes are skipped.
 
     Arguments:
-        package (Package): An instance of the Package dataclass containing the parsed recipe data.
-        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        recipes_dir (str): The directory containing the <name>.json recipe files.
+
+    Returns:
+        dict: The recipe index.
+    """
+    import hashlib
+
+    recipes = {}
+    for file_name in sorted(os.listdir(recipes_dir)):
+        if not file_name.endswith(".json") or file_name == recipe_index_name:
+            continue
+        package_data = read_json_file(os.path.join(recipes_dir, file_name))
+        if not isinstance(package_data, dict):
+            continue
+        try:
+            Package(**package_data)
+        except TypeError:
+            continue
+        recipes[os.path.splitext(file_name)[0]] = package_data
+
+    version = hashlib.sha256(json.dumps(recipes, sort_keys=True).encode()).hexdigest()[:16]
+    return {"version": version, "recipes": recipes}
+
+
+def write_recipe_index(recipes_dir: str) -> dict:
+    """
+    Builds the recipe index of a directory with build_recipe_index and writes it to index.json in
+    that directory.
+
+    Arguments:
+        recipes_dir (str): The directory containing the <name>.json recipe files.
+
+    Returns:
+        dict: The recipe index.
+    """
+    index = build_recipe_index(recipes_dir)
+    with open(os.path.join(recipes_dir, recipe_index_name), "w") as file:
+        json.dump(index, file, indent=2)
+        file.write("\n")
+    return index
+
+
+def recipe_index_is_current(recipes_dir: str) -> bool:
+    """
+    Tells whether the index.json of a directory matches its recipe files, as built by
+    build_recipe_index. Recipes are looked up in the index before their own files, so an index that
+    was not rebuilt after a recipe changed keeps serving the old recipe.
+
+    Arguments:
+        recipes_dir (str): The directory containing the <name>.json recipe files.
+
+    Returns:
+        bool: Whether the index is up to date. A missing index is not.
+    """
+    return read_json_file(os.path.join(recipes_dir, recipe_index_name)) == build_recipe_index(recipes_dir)
+
+
+class DependencyCycleError(ValueError):
+    """
+    Raised when the install_dependencies of a set of packages form a cycle.
+
+    Attributes:
+        cycle (List[str]): The package names forming the cycle, starting and ending with the same package.
+    """
+
+    def __init__(self, cycle: List[str]):
+        self.cycle = cycle
+        super().__init__(f"Dependency cycle detected: {' -> '.join(cycle)}")
+
+
+def resolve_install_plan(packages: Dict[str, Package]) -> Dict[str, Package]:
+    """
+    Resolves the complete dependency tree of one or more packages into a single flattened install plan
+    before any work begins. Every package is fetched and planned once, no matter how many packages
+    depend on it, and cycles in install_dependencies are reported instead of being followed.
+
+    Arguments:
+        packages (Dict[str, Package]): The packages whose dependencies should be resolved, keyed by the
+            name they are referred to by in install_dependencies.
+
+    Returns:
+        Dict[str, Package]: The packages to install keyed by name, in installation order: every package
+        comes after all of its dependencies.
 
     Raises:
-        ValueError: If the installation strategy is not supported.
-        Exception: If there is an error during the installation process.
+        DependencyCycleError: If the dependencies contain a cycle.
     """
+    recipes = dict(packages)
+    plan = {}
+    for root_name, root_package in packages.items():
+        if root_name in plan:
+            continue
+        path = [root_name]
+        # Iterative depth-first search; each stack entry is a package name and an iterator over its
+        # dependencies, so deep dependency chains cannot exhaust the interpreter stack.
+        stack = [(root_name, iter(root_package.install_dependencies or []))]
+        while stack:
+            name, dependencies = stack[-1]
+            dependency_name = next(dependencies, None)
+            if dependency_name is None:
+                stack.pop()
+                path.pop()
+                plan[name] = recipes[name]
+                continue
+            if dependency_name in plan:
+                continue
+            if dependency_name in path:
+                raise DependencyCycleError(path[path.index(dependency_name):] + [dependency_name])
+            if dependency_name not in recipes:
+                recipes[dependency_name] = fetch_and_parse_recipe(dependency_name)
+            stack.append((dependency_name, iter(recipes[dependency_name].install_dependencies or [])))
+            path.append(dependency_name)
+
+    return plan
+
+
+@contextlib.contextmanager
+def open_state_db():
+    """
+    Opens the state database at settings.state_db, creating it if needed, for a single transaction
+    that is committed when the block exits without an exception. Every package has one row holding
+    its installed version, the hash and JSON of the recipe it was installed from, the time of the
+    installation, the paths it installed, its dependencies, and whether it was installed explicitly
+    rather than as a dependency. Connections are not shared, so that any thread can use the database.
+
+    Yields:
+        sqlite3.Connection: The connection to the database.
+    """
+    import sqlite3
+
+    os.makedirs(os.path.dirname(os.path.abspath(settings.state_db)), exist_ok=True)
+    connection = sqlite3.connect(settings.state_db, timeout=30)
     try:
-        # Install dependencies first
-        for dependency_name in package.install_dependencies:
-            logger.info(f"Installing dependency '{dependency_name}'")
-            dependency_package = fetch_and_parse_recipe(dependency_name)
-            install_package(dependency_package, logger)
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS packages ("
+                "name TEXT PRIMARY KEY, version TEXT, recipe_hash TEXT, installed_at REAL, "
+                "paths TEXT, dependencies TEXT, recipe TEXT, explicit INTEGER NOT NULL DEFAULT 0)"
+            )
+            yield connection
+    finally:
+        connection.close()
+
+
+def recipe_data(package: Package) -> dict:
+    """
+    Returns the recipe data a package was created from as fetched, without the defaults of the fields
+    it leaves out, so that adding a field to Package does not change it. Packages that were not
+    fetched by fetch_and_parse_recipe fall back to all of their fields.
 
-        logger.info(f"Installing package '{package.name}'")
-        if package.strategy == "vendor_install":
-            vendor_install(package, logger)
-        elif package.strategy == "zip_install":
-            zip_install(package, logger)
-        else:
-            raise ValueError(f"Unsupported installation strategy '{package.strategy}'")
-        
-        logger.info(f"Installation of '{package.name}' completed successfully")
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
 
-    except Exception as e:
-        logger.error(f"Installation of '{package.name}' failed: {str(e)}")
-        raise
+    Returns:
+        dict: The recipe data, which Package(**data) turns back into the package.
+    """
+    if package.recipe:
+        return package.recipe
+    data = dataclasses.asdict(package)
+    del data["recipe"], data["recipe_name"]
+    return data
 
 
-def download_and_verify_package(package, logger) -> str:
+def recipe_hash(package: Package) -> str:
     """
-    Downloads the package from the specified location, verifies the checksum (if provided),
-    and extracts the package if it's a zip or tar.gz file.
+    Computes the hash of the recipe a package is installed from, which changes whenever any field
+    of the recipe does.
 
     Arguments:
         package (Package): An instance of the Package dataclass containing the parsed recipe data.
-        logger (logging.Logger): A logger instance for logging messages during the download and verification process.
 
     Returns:
-        str: The path to the downloaded package file or the extracted directory.
-
-    Raises:
-        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+        str: The SHA-256 hash of the recipe data, see recipe_data.
     """
-    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-        # Download the package
-        logger.info(f"Downloading package '{package.name}'")
-        response = requests.get(package.location, stream=True)
-        response.raise_for_status()
+    import hashlib
 
-        # Save the package to a temporary file
-        for chunk in response.iter_content(chunk_size=8192):
-            temp_file.write(chunk)
+    return hashlib.sha256(json.dumps(recipe_data(package), sort_keys=True).encode()).hexdigest()
 
-        # Close the temporary file
-        temp_file.close()
 
-        # Verify the checksum if provided
-        if package.checksum:
-            logger.info(f"Verifying checksum for package '{package.name}'")
-            with open(temp_file.name, 'rb') as file:
-                file_hash = hashlib.sha256(file.read()).hexdigest()
+def installed_paths(package: Package) -> List[str]:
+    """
+    Returns the paths a package installs, as far as rootbeer knows them: the copy_destination of "cp"
+    packages, which copy_install only installs at paths the package owns. The paths written by install
+    scripts are not known.
 
-            if file_hash != package.checksum.lower():
-                os.remove(temp_file.name)
-                raise ValueError(f"Checksum mismatch for package '{package.name}'")
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
 
-        # Extract the package if it's a zip or tar.gz file
-        extracted_dir = None
-        if temp_file.name.endswith('.zip'):
-            extracted_dir = os.path.splitext(temp_file.name)[0]
-            with zipfile.ZipFile(temp_file.name, 'r') as zip_ref:
-                zip_ref.extractall(extracted_dir)
-            os.remove(temp_file.name)
-        elif temp_file.name.endswith('.tar.gz'):
-            extracted_dir = os.path.splitext(os.path.splitext(temp_file.name)[0])[0]
-            with tarfile.open(temp_file.name, 'r:gz') as tar_ref:
-                tar_ref.extractall(extracted_dir)
-            os.remove(temp_file.name)
-
-        if extracted_dir:
-            return extracted_dir
-        else:
-            return temp_file.name
+    Returns:
+        List[str]: The installed paths.
+    """
+    if package.installer_type == "cp" and package.copy_destination:
+        return [package.copy_destination.format(**script_format_args(""))]
+    return []
 
 
-def run_script(script: str, logger: logging.Logger, **format_args)  -> None:
+def owns_installed_path(package: Package, path: str) -> bool:
     """
-    Runs a given script as a temporary shell script or PowerShell script, depending on the platform.
+    Tells whether a path is recorded in the state database as installed by an installed version of a
+    package, so that installing the package again may replace it.
 
     Arguments:
-        script (str): The script to be executed, either as a shell script or PowerShell script.
-        logger (logging.Logger): A logger instance for logging messages during the execution process.
-        **format_args: Keyword arguments to be passed to the script.format() method, for replacing placeholders in the script.
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        path (str): The path to check, as returned by installed_paths.
 
-    Raises:
-        subprocess.CalledProcessError: If the script execution fails.
+    Returns:
+        bool: Whether the package owns the path.
     """
-    is_windows = platform.system() == "Windows"
-    script_name = "script.ps1" if is_windows else "script.sh"
+    return any(path in record["paths"] and record["recipe"].get("name") == package.name
+               for record in get_installed_packages().values())
 
-    with tempfile.NamedTemporaryFile(mode="w", prefix="pkg_manager_", suffix=script_name, delete=False) as script_file:
-        script_file.write(script.format(**format_args))
-        script_file.flush()
-        script_file.seek(0)
 
-    try:
-        if is_windows:
-            result = subprocess.run(["powershell", "-ExecutionPolicy", "Unrestricted", "-File", script_file.name], check=True)
-            logger.debug(result.stdout)
-        else:
-            result = subprocess.run(["bash", script_file.name], check=True)
-            logger.debug(result.stdout)
-    
-    except subprocess.CalledProcessError as e:
-        logger.error(e.stderr)
-        raise
+def get_installed_packages() -> Dict[str, dict]:
+    """
+    Reads the installed packages from the state database.
 
-    os.remove(script_file.name)
+    Returns:
+        Dict[str, dict]: The rows of the installed packages keyed by package name, with the paths,
+        dependencies and recipe decoded from JSON and explicit as a bool.
+    """
+    with open_state_db() as connection:
+        rows = connection.execute(
+            "SELECT name, version, recipe_hash, installed_at, paths, dependencies, recipe, explicit FROM packages"
+        ).fetchall()
+    return {
+        name: {
+            "name": name,
+            "version": version,
+            "recipe_hash": package_recipe_hash,
+            "installed_at": installed_at,
+            "paths": json.loads(paths),
+            "dependencies": json.loads(dependencies),
+            "recipe": json.loads(recipe),
+            "explicit": bool(explicit),
+        }
+        for name, version, package_recipe_hash, installed_at, paths, dependencies, recipe, explicit in rows
+    }
 
 
+def record_installed_package(name: str, package: Package) -> None:
+    """
+    Records a successfully installed package in the state database, replacing the record of any
+    version installed before but keeping whether it was installed explicitly.
 
-def vendor_install(package: Package, logger: logging.Logger) -> None:
+    Arguments:
+        name (str): The name of the package in the install plan.
+        package (Package): The Package instance it was installed from.
     """
-    Installs a software package using the vendor_install strategy, which downloads and runs the installer provided by the vendor.
+    with open_state_db() as connection:
+        connection.execute(
+            "INSERT INTO packages (name, version, recipe_hash, installed_at, paths, dependencies, recipe) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(name) DO UPDATE SET "
+            "version = excluded.version, recipe_hash = excluded.recipe_hash, installed_at = excluded.installed_at, "
+            "paths = excluded.paths, dependencies = excluded.dependencies, recipe = excluded.recipe",
+            (name, package.version, recipe_hash(package), time.time(), json.dumps(installed_paths(package)),
+             json.dumps(package.install_dependencies or []), json.dumps(recipe_data(package))),
+        )
+
+
+def mark_explicit_packages(package_names: List[str]) -> None:
+    """
+    Marks installed packages as explicitly installed, as opposed to installed as a dependency.
+    Packages that are not recorded as installed are left alone.
 
     Arguments:
-        package (Package): A Package instance containing the package information and installation instructions.
-        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        package_names (List[str]): The names of the packages that were requested explicitly.
+    """
+    with open_state_db() as connection:
+        connection.executemany("UPDATE packages SET explicit = 1 WHERE name = ?",
+                               [(package_name,) for package_name in package_names])
 
-    Raises:
-        ValueError: If the checksum of the downloaded package does not match the expected checksum.
-        subprocess.CalledProcessError: If the script execution fails during the installation process.
+
+def set_explicit_packages(package_names: List[str]) -> None:
     """
-    package_file = download_and_verify_package(package, logger)
-    format_args = {
-        'package_file': package_file,
-        'user_path': user_path,
-        'system_path': system_path,
-        'system_path_x86': system_path_x86
-    }
-    if package.pre_install:
-        logger.info("Running pre-install script")
-        run_script(package.pre_install.format(**format_args), logger, **format_args)
-    if package.install:
-        logger.info("Running install script")
-        run_script(package.install.format(**format_args), logger, **format_args)
-    if package.post_install:
-        logger.info("Running post-install script")
-        run_script(package.post_install.format(**format_args), logger, **format_args)
-    if os.path.isdir(package_file):
-        shutil.rmtree(package_file)
-    else:
-        os.remove(package_file)
+    Makes the given installed packages the explicitly installed ones, marking every other installed
+    package as installed as a dependency.
 
-def find_binary_file(root_dir) -> Optional[str]:
+    Arguments:
+        package_names (List[str]): The names of the packages that are requested explicitly.
+    """
+    with open_state_db() as connection:
+        connection.execute("UPDATE packages SET explicit = 0")
+        connection.executemany("UPDATE packages SET explicit = 1 WHERE name = ?",
+                               [(package_name,) for package_name in package_names])
+
+
+def remove_installed_package(name: str) -> None:
     """
-    Recursively searches for a binary file with one of the specified extensions (.exe, .msi, .dmg, .pkg)
-    starting from the root directory.
+    Removes the record of an uninstalled package from the state database.
 
     Arguments:
-        root_dir (str): The root directory to start the search from.
+        name (str): The name of the package.
+    """
+    with open_state_db() as connection:
+        connection.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+
+def pending_install_plan(plan: Dict[str, Package], logger: logging.Logger) -> Dict[str, Package]:
+    """
+    Leaves out of an install plan the packages whose version and recipe are recorded as installed in
+    the state database, unless settings.force is set, so that re-running an installation only
+    installs what changed.
+
+    Arguments:
+        plan (Dict[str, Package]): The install plan as returned by resolve_install_plan.
+        logger (logging.Logger): A logger instance for logging the packages that are skipped.
 
     Returns:
-        Optional[str]: The path to the binary file if found, otherwise None.
+        Dict[str, Package]: The packages of the plan that need to be installed, in plan order.
     """
-    extensions = ['.exe', '.msi', '.dmg', '.pkg']
-    for root, dirs, files in os.walk(root_dir):
-        for file in files:
-            if os.path.splitext(file)[-1].lower() in extensions:
-                return os.path.join(root, file)
-    return None
+    if settings.force:
+        return plan
+    installed = get_installed_packages()
+    pending = {}
+    for name, planned in plan.items():
+        record = installed.get(name)
+        if record and record["version"] == planned.version and record["recipe_hash"] == recipe_hash(planned):
+            logger.info(f"Package '{name}' {planned.version} is already installed")
+        else:
+            pending[name] = planned
+    return pending
+
 
-def extract_package(package_file: str, extract_dir: str) -> None:
+def prepare_package(package: Package, logger: logging.Logger) -> Optional[str]:
     """
-    Extracts the given package archive file into the specified directory.
-    Supports .zip, .tar, .tar.gz, .tar.bz2, and .tar.xz archive formats.
+    Runs the download stage of the installation strategy of a package, which does not depend on any
+    other package being installed and can therefore run ahead of the install stage: vendor_install
+    packages are downloaded and zip_install packages are extracted into a temporary directory.
 
     Arguments:
-        package_file (str): The path to the package archive file.
-        extract_dir (str): The directory to extract the contents of the package file into.
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the download.
+
+    Returns:
+        Optional[str]: The prepared package to pass to install_single_package, or None if the strategy
+        has no download stage.
+
+    Raises:
+        Exception: If there is an error during the download or extraction.
     """
-    shutil.unpack_archive(package_file, extract_dir)
-        
+    import tempfile
+
+    try:
+        if package.strategy == "vendor_install":
+            return download_and_verify_package(package, logger)
+        elif package.strategy == "zip_install":
+            extract_dir = tempfile.mkdtemp()
+            try:
+                extract_package(package.location, extract_dir, package.installer_member)
+            except Exception:
+                shutil.rmtree(extract_dir)
+                raise
+            return extract_dir
+        return None
+
+    except Exception as e:
+        logger.error(f"Installation of '{package.name}' failed: {str(e)}")
+        raise
+
 
-def zip_install(package: Package, logger: logging.Logger) -> None:
+def remove_path(path: str) -> None:
     """
-    Installs a software package using the zip_install strategy.
-    The package is expected to be in a .zip archive. The function extracts the archive,
-    finds the binary installer file, and runs the pre-install, install, and post-install scripts.
+    Removes a downloaded file or an extracted directory. Nothing is done if the path no longer exists,
+    which is the case when a "cp" installation moved it into place.
 
     Arguments:
-        package (Package): The Package object containing the package information.
-        logger (logging.Logger): The logger object for logging events during the installation process.
+        path (str): The path of the file or directory to remove.
     """
-    # Extract the package zip file to a temporary directory
-    with tempfile.TemporaryDirectory() as temp_dir:
-        extract_package(package.location, temp_dir)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
 
-        # Find the binary installer file
-        package_file = find_binary_file(temp_dir)
 
-        if not package_file:
-            raise ValueError(f"Installer file not found in '{package.location}'")
+def install_single_package(package: Package, logger: logging.Logger, prepared: Optional[str] = None) -> None:
+    """
+    Installs a single package, without its dependencies, by following the installation strategy
+    defined in the Package object.
 
-        # Run pre-install, install, and post-install scripts
-        format_args = {
-            'package_file': package_file,
-            'user_path': user_path,
-            'system_path': system_path,
-            'system_path_x86': system_path_x86
-        }
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        prepared (Optional[str]): The package as returned by prepare_package, if its download stage has
+            already run. The strategy downloads the package itself if None.
 
-        if package.pre_install:
-            logger.info("Running pre-install script")
-            run_script(package.pre_install.format(**format_args), logger, **format_args)
-        if package.install:
-            logger.info("Running install script")
-            run_script(package.install.format(**format_args), logger, **format_args)
-        if package.post_install:
-            logger.info("Running post-install script")
-            run_script(package.post_install.format(**format_args), logger, **format_args)
-    
-def main() -> None:
-    """
-    The entry point of the script. This function parses the command-line arguments, fetches the
-    recipe for the specified package, configures the logger, and performs the install or uninstall
-    action as requested.
+    Raises:
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
     """
-    args = parse_arguments()
-    package_name, action = args.package_name, args.action
-    package = fetch_and_parse_recipe(package_name)
+    try:
+        logger.info(f"Installing package '{package.name}'")
+        if package.strategy == "vendor_install":
+            vendor_install(package, logger, prepared)
+        elif package.strategy == "zip_install":
+            zip_install(package, logger, prepared)
+        else:
+            raise ValueError(f"Unsupported installation strategy '{package.strategy}'")
 
-    logger = configure_logger(package_name)
+        logger.info(f"Installation of '{package.name}' completed successfully")
 
-    if action == "install":
-        install_package(package, logger)
-    elif action == "uninstall":
-        # Add logic to handle uninstallation here
-        pass
+    except Exception as e:
+        logger.error(f"Installation of '{package.name}' failed: {str(e)}")
+        raise
+
+
+def upgrade_single_package(package: Package, record: dict, logger: logging.Logger,
+                           prepared: Optional[str] = None) -> None:
+    """
+    Replaces an installed version of a package with the version of its recipe, as a single transaction:
+    the installed version is uninstalled with the recipe it was installed from, then the new version is
+    installed. If the new version fails to install, the installed version is installed again from its
+    recipe, with its artifact taken from the artifact cache when it is still there.
+
+    Arguments:
+        package (Package): The Package instance of the new version.
+        record (dict): The record of the installed version, as returned by get_installed_packages.
+        logger (logging.Logger): A logger instance for logging messages during the upgrade.
+        prepared (Optional[str]): The new version as returned by prepare_package, if its download stage
+            has already run, so that the installed version is only removed once the new one is at hand.
+
+    Raises:
+        Exception: If there is an error during the upgrade. The installed version is restored if possible,
+        and its record is removed from the state database if not.
+    """
+    installed_package = Package(**record["recipe"])
+    logger.info(f"Upgrading package '{record['name']}' from {record['version']} to {package.version}")
+    try:
+        run_uninstall_scripts(installed_package, record["paths"], logger)
+    except Exception as e:
+        logger.error(f"Uninstallation of '{record['name']}' {record['version']} failed: {str(e)}")
+        if prepared:
+            remove_path(prepared)
+        raise
+
+    try:
+        install_single_package(package, logger, prepared)
+    except Exception:
+        logger.warning(f"Restoring package '{record['name']}' {record['version']}")
+        try:
+            install_single_package(installed_package, logger)
+        except Exception:
+            remove_installed_package(record["name"])
+        raise
+
+
+def execute_install_plan(plan: Dict[str, Package], logger: logging.Logger, jobs: int = 1,
+                         upgrades: Optional[Dict[str, dict]] = None) -> None:
+    """
+    Installs the packages of an install plan on a pool of at most `jobs` workers, each package starting
+    as soon as all of its dependencies have been installed, so that independent branches of the plan
+    are installed concurrently. After a failure no further packages are started. Every package that is
+    installed successfully is recorded in the state database, see record_installed_package. Dependencies
+    that are not part of the plan, because they are already installed, are not waited for.
+
+    Installation is pipelined: the download stage of each package (see prepare_package) runs on a
+    separate pool of `jobs` workers, ahead of installation in plan order, so that downloads of the next
+    packages overlap with the install scripts of the current ones. At most `jobs` packages are kept
+    downloaded ahead of their installation.
+
+    Arguments:
+        plan (Dict[str, Package]): The install plan as returned by resolve_install_plan.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+        upgrades (Optional[Dict[str, dict]]): The records of the installed versions of the packages of the
+            plan that are upgraded, see upgrade_single_package, keyed by package name.
+
+    Raises:
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    upgrades = upgrades or {}
+    if not plan:
+        logger.info("All packages are already installed")
+        return
+    logger.info(f"Install plan: {', '.join(plan)}")
+    waiting_on = {name: set(planned.install_dependencies or []) & plan.keys() for name, planned in plan.items()}
+    downloads = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as download_executor, ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        failure = None
+        while waiting_on or running:
+            pending_downloads = []
+            if failure is None:
+                ready = [name for name in plan if name in waiting_on and not waiting_on[name]]
+                for name in ready:
+                    if name not in downloads:
+                        downloads[name] = download_executor.submit(prepare_package, plan[name], logger)
+                    if not downloads[name].done():
+                        pending_downloads.append(downloads[name])
+                    elif downloads[name].exception() is not None:
+                        failure = downloads[name].exception()
+                        break
+                    else:
+                        del waiting_on[name]
+                        if name in upgrades:
+                            future = executor.submit(upgrade_single_package, plan[name], upgrades[name], logger,
+                                                     downloads[name].result())
+                        else:
+                            future = executor.submit(install_single_package, plan[name], logger,
+                                                     downloads[name].result())
+                        running[future] = name
+
+                # Keep up to `jobs` packages downloading or downloaded ahead of their installation
+                for name in plan:
+                    if failure is not None or len([other for other in downloads if other in waiting_on]) >= jobs:
+                        break
+                    if name not in downloads:
+                        downloads[name] = download_executor.submit(prepare_package, plan[name], logger)
+
+            if failure is not None:
+                for name in waiting_on:
+                    if name in downloads:
+                        downloads[name].cancel()
+                pending_downloads = []
+
+            if not running and not pending_downloads:
+                break
+
+            done, _ = wait(list(running) + pending_downloads, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future not in running:
+                    continue
+                name = running.pop(future)
+                if future.exception() is not None:
+                    failure = failure or future.exception()
+                    continue
+                record_installed_package(name, plan[name])
+                for dependencies in waiting_on.values():
+                    dependencies.discard(name)
+
+    # Discard the packages that were downloaded but never installed
+    for name in waiting_on:
+        download = downloads.get(name)
+        if download is not None and not download.cancelled() and download.exception() is None and download.result():
+            remove_path(download.result())
+
+    if failure is not None:
+        raise failure
+
+
+def install_package(package: Package, logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    Installs the specified package together with its dependencies. The dependencies are resolved
+    into an install plan up front, which is then installed by execute_install_plan, leaving out the
+    packages that are already installed (see pending_install_plan). The package is keyed by the name
+    its recipe was fetched under, as install_packages does, falling back to its name.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle.
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    name = package.recipe_name or package.name
+    try:
+        execute_install_plan(pending_install_plan(resolve_install_plan({name: package}), logger), logger, jobs)
+    finally:
+        mark_explicit_packages([name])
+
+
+def install_packages(package_names: List[str], logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    Installs several packages together with their dependencies in one run. The packages are resolved
+    into a single combined install plan, so that shared dependencies are installed once, and the plan
+    is installed by execute_install_plan with the caches and HTTP session of the run shared by all.
+    Packages that are already installed are left out, see pending_install_plan. The requested packages
+    are recorded as installed explicitly.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to install.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle.
+        ValueError: If a recipe cannot be fetched or an installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    packages = {package_name: fetch_and_parse_recipe(package_name) for package_name in package_names}
+    try:
+        execute_install_plan(pending_install_plan(resolve_install_plan(packages), logger), logger, jobs)
+    finally:
+        mark_explicit_packages(package_names)
+
+
+def uninstall_single_package(name: str, record: dict, logger: logging.Logger) -> None:
+    """
+    Uninstalls a single installed package, without its dependencies or dependents, with the recipe it
+    was installed from, and removes its record from the state database.
+
+    Arguments:
+        name (str): The name of the package.
+        record (dict): The record of the package, as returned by get_installed_packages.
+        logger (logging.Logger): A logger instance for logging messages during the uninstallation process.
+
+    Raises:
+        Exception: If there is an error during the uninstallation process.
+    """
+    try:
+        logger.info(f"Uninstalling package '{name}'")
+        run_uninstall_scripts(Package(**record["recipe"]), record["paths"], logger)
+        remove_installed_package(name)
+        logger.info(f"Uninstallation of '{name}' completed successfully")
+
+    except Exception as e:
+        logger.error(f"Uninstallation of '{name}' failed: {str(e)}")
+        raise
+
+
+class InstalledDependentsError(ValueError):
+    """
+    Raised when packages are to be uninstalled while other installed packages depend on them.
+
+    Attributes:
+        dependents (Dict[str, List[str]]): The names of the installed dependents of each such package.
+    """
+
+    def __init__(self, dependents: Dict[str, List[str]]):
+        self.dependents = dependents
+        details = "; ".join(f"'{name}' is required by {', '.join(names)}" for name, names in dependents.items())
+        super().__init__(f"{details}. Use --cascade to uninstall the dependents as well")
+
+
+def resolve_uninstall_plan(package_names: List[str], installed: Dict[str, dict],
+                           cascade: bool = False) -> List[str]:
+    """
+    Resolves the packages to uninstall for a request to uninstall the given packages. The
+    uninstall_dependencies of their recipes are uninstalled along with them, unless they were installed
+    explicitly or a package that stays installed still depends on them. Installed packages that depend
+    on a requested package are uninstalled as well with cascade, and make the request fail otherwise.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to uninstall.
+        installed (Dict[str, dict]): The installed packages, as returned by get_installed_packages.
+        cascade (bool): Whether the installed dependents of the packages are uninstalled too.
+
+    Returns:
+        List[str]: The names of the packages to uninstall.
+
+    Raises:
+        ValueError: If a package is not installed.
+        InstalledDependentsError: If other installed packages depend on the packages and cascade is False.
+    """
+    missing = [name for name in package_names if name not in installed]
+    if missing:
+        raise ValueError(f"Packages not installed: {', '.join(missing)}")
+
+    dependents = {name: set() for name in installed}
+    for name, record in installed.items():
+        for dependency_name in record["dependencies"]:
+            if dependency_name in dependents:
+                dependents[dependency_name].add(name)
+
+    requested = set(package_names)
+    pending = list(package_names)
+    while cascade and pending:
+        for dependent_name in dependents[pending.pop()] - requested:
+            requested.add(dependent_name)
+            pending.append(dependent_name)
+
+    blocked = {name: sorted(dependents[name] - requested) for name in package_names if dependents[name] - requested}
+    if blocked:
+        raise InstalledDependentsError(blocked)
+
+    removing = set(requested)
+    pending = list(requested)
+    while pending:
+        for dependency_name in installed[pending.pop()]["recipe"].get("uninstall_dependencies") or []:
+            record = installed.get(dependency_name)
+            if record is not None and not record["explicit"] and dependency_name not in removing:
+                removing.add(dependency_name)
+                pending.append(dependency_name)
+
+    # Dependencies still needed by a package that stays installed are kept, and so are the ones
+    # only they would have brought along
+    while True:
+        kept = {name for name in removing - requested if dependents[name] - removing}
+        if not kept:
+            break
+        removing -= kept
+    return [name for name in installed if name in removing]
+
+
+def execute_uninstall_plan(removals: List[str], installed: Dict[str, dict], logger: logging.Logger,
+                           jobs: int = 1) -> None:
+    """
+    Uninstalls packages on a pool of at most `jobs` workers. Each package is uninstalled as soon as
+    every package being uninstalled that depends on it is gone, so that independent packages are
+    uninstalled concurrently and no package is removed while a package that uses it is still
+    installed. After a failure no further packages are started.
+
+    Arguments:
+        removals (List[str]): The names of the packages to uninstall, see resolve_uninstall_plan.
+        installed (Dict[str, dict]): The installed packages, as returned by get_installed_packages.
+        logger (logging.Logger): A logger instance for logging messages during the uninstallation process.
+        jobs (int): The maximum number of packages to uninstall concurrently.
+
+    Raises:
+        Exception: If there is an error during the uninstallation process.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    if not removals:
+        return
+    logger.info(f"Uninstall plan: {', '.join(removals)}")
+    waiting_on = {name: {other for other in removals if name in installed[other]["dependencies"]} for name in removals}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        failure = None
+        while waiting_on or running:
+            if failure is None:
+                for name in [name for name in removals if name in waiting_on and not waiting_on[name]]:
+                    del waiting_on[name]
+                    running[executor.submit(uninstall_single_package, name, installed[name], logger)] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    failure = failure or future.exception()
+                    continue
+                for dependents in waiting_on.values():
+                    dependents.discard(name)
+
+    if failure is not None:
+        raise failure
+
+
+def uninstall_packages(package_names: List[str], logger: logging.Logger, jobs: int = 1, cascade: bool = False) -> None:
+    """
+    Uninstalls the specified packages together with their recipes' uninstall_dependencies, see
+    resolve_uninstall_plan, concurrently where the installed dependencies allow.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to uninstall.
+        logger (logging.Logger): A logger instance for logging messages during the uninstallation process.
+        jobs (int): The maximum number of packages to uninstall concurrently.
+        cascade (bool): Whether the installed packages that depend on the packages are uninstalled too.
+
+    Raises:
+        ValueError: If a package is not installed.
+        InstalledDependentsError: If other installed packages depend on the packages and cascade is False.
+        Exception: If there is an error during the uninstallation process.
+    """
+    installed = get_installed_packages()
+    execute_uninstall_plan(resolve_uninstall_plan(package_names, installed, cascade), installed, logger, jobs)
+
+
+def upgrade_packages(package_names: List[str], logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    Upgrades installed packages whose recipe has a different version than the installed one. The new
+    artifacts are downloaded ahead by execute_install_plan, then each package is upgraded in a single
+    uninstall and install transaction, see upgrade_single_package, concurrently where the dependencies
+    allow. Dependencies that the new versions need and that are not installed yet are installed first.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to upgrade. Every installed package is
+            considered if the list is empty, with the recipes taken from the recipe index in one request.
+        logger (logging.Logger): A logger instance for logging messages during the upgrade.
+        jobs (int): The maximum number of packages to upgrade concurrently.
+
+    Raises:
+        ValueError: If a package is not installed or its recipe cannot be fetched.
+        DependencyCycleError: If the dependencies contain a cycle.
+        Exception: If there is an error during the upgrade.
+    """
+    installed = get_installed_packages()
+    package_names = package_names or list(installed)
+    missing = [name for name in package_names if name not in installed]
+    if missing:
+        raise ValueError(f"Packages not installed: {', '.join(missing)}")
+
+    load_recipe_index()
+    outdated = {}
+    for name in package_names:
+        package = fetch_and_parse_recipe(name)
+        if package.version == installed[name]["version"]:
+            logger.info(f"Package '{name}' {package.version} is up to date")
+        else:
+            outdated[name] = package
+
+    plan = {name: planned for name, planned in resolve_install_plan(outdated).items()
+            if name in outdated or name not in installed}
+    execute_install_plan(plan, logger, jobs, upgrades={name: installed[name] for name in outdated})
+
+
+def sync_packages(package_names: List[str], logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    Converges the installed packages to a desired set. The desired packages are resolved into an
+    install plan together with their dependencies and compared with the state database: installed
+    packages that are not part of the plan any more are uninstalled by execute_uninstall_plan, and the
+    packages of the plan that are missing or whose version or recipe changed are installed by
+    execute_install_plan, both concurrently where the dependencies allow. Changed packages are upgraded
+    as by the upgrade action, uninstalling the installed version first, see upgrade_single_package. A
+    run in which nothing changed only reads the recipes and the database.
+
+    Arguments:
+        package_names (List[str]): The names of the packages that should be installed explicitly.
+        logger (logging.Logger): A logger instance for logging messages during the synchronization.
+        jobs (int): The maximum number of packages to install or uninstall concurrently.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle.
+        ValueError: If a recipe cannot be fetched or an installation strategy is not supported.
+        Exception: If there is an error during the installation or uninstallation process.
+    """
+    packages = {package_name: fetch_and_parse_recipe(package_name) for package_name in package_names}
+    plan = resolve_install_plan(packages)
+    installed = get_installed_packages()
+
+    removals = [name for name in installed if name not in plan]
+    if removals:
+        logger.info(f"Removing packages that are no longer wanted: {', '.join(removals)}")
+    execute_uninstall_plan(removals, installed, logger, jobs)
+
+    pending = pending_install_plan(plan, logger)
+    try:
+        execute_install_plan(pending, logger, jobs,
+                             upgrades={name: installed[name] for name in pending if name in installed})
+    finally:
+        set_explicit_packages(package_names)
+
+
+def checkout_cached_artifact(cache_key: Optional[str], suffix: str = "") -> Optional[str]:
+    """
+    Looks up a downloaded artifact in the artifact cache and, if present, gives the caller its own
+    path to it: a hard link next to the cache, or a copy where hard links are not supported. The
+    caller may delete the returned file without affecting the cache.
+
+    Artifacts are cached under their cache key followed by the suffix of the download they were stored
+    from, so that the checkout is named, and extracted, like the original download even when the
+    suffix was only known from the response.
+
+    Arguments:
+        cache_key (Optional[str]): The cache key of the artifact, as used by download_and_verify_package.
+        suffix (str): The suffix of the checked out file name, such as ".tar.gz", if the artifact was
+            cached without one.
+
+    Returns:
+        Optional[str]: The path to the checked out artifact, or None if it is not cached.
+    """
+    import uuid
+
+    if not cache_key or settings.artifact_cache_size <= 0:
+        return None
+
+    artifacts_dir = os.path.join(settings.cache_dir, "artifacts")
+    try:
+        cached_file = next(entry.path for entry in os.scandir(artifacts_dir) if entry.name.startswith(cache_key))
+    except (FileNotFoundError, StopIteration):
+        return None
+    suffix = os.path.basename(cached_file)[len(cache_key):] or suffix
+    checkout_dir = os.path.join(settings.cache_dir, "checkouts")
+    os.makedirs(checkout_dir, exist_ok=True)
+    checkout_file = os.path.join(checkout_dir, uuid.uuid4().hex + suffix)
+    try:
+        # The modification time records the last use of an artifact for LRU eviction.
+        os.utime(cached_file)
+        try:
+            os.link(cached_file, checkout_file)
+        except OSError:
+            shutil.copyfile(cached_file, checkout_file)
+    except FileNotFoundError:
+        return None
+
+    return checkout_file
+
+
+def store_cached_artifact(cache_key: Optional[str], package_file: str) -> None:
+    """
+    Adds a downloaded artifact to the artifact cache and evicts the least recently used artifacts
+    until the cache fits in settings.artifact_cache_size again.
+
+    Arguments:
+        cache_key (Optional[str]): The cache key of the artifact. Nothing is stored if it is None.
+        package_file (str): The path to the downloaded artifact, named with the suffix of the download,
+            see new_checkout_file. The file is left in place.
+    """
+    import uuid
+
+    if not cache_key or os.path.getsize(package_file) > settings.artifact_cache_size:
+        return
+
+    artifacts_dir = os.path.join(settings.cache_dir, "artifacts")
+    os.makedirs(artifacts_dir, exist_ok=True)
+    staged_file = os.path.join(artifacts_dir, f".{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(package_file, staged_file)
+    except OSError:
+        shutil.copyfile(package_file, staged_file)
+    os.utime(staged_file)
+    cached_name = cache_key + archive_suffix(package_file)
+    os.replace(staged_file, os.path.join(artifacts_dir, cached_name))
+
+    entries = []
+    for entry in os.scandir(artifacts_dir):
+        if entry.name.startswith(cache_key) and entry.name != cached_name:
+            # The same artifact cached under another suffix
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry.path)
+        elif entry.is_file() and not entry.name.startswith("."):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= settings.artifact_cache_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def iter_response_chunks(response: requests.Response, chunk_size: int):
+    """
+    Iterates over the body of a streaming response in chunks of up to chunk_size bytes. Bodies without a
+    Content-Encoding are read with readinto into a single reused buffer, avoiding an allocation per
+    chunk; encoded bodies are decoded through iter_content.
+
+    Each chunk is only valid until the next one is requested, so callers must consume it immediately.
+
+    Arguments:
+        response (requests.Response): A response obtained with stream=True.
+        chunk_size (int): The maximum size of a chunk in bytes.
+
+    Yields:
+        memoryview: The next chunk of the body.
+    """
+    if response.headers.get("Content-Encoding", "identity").lower() != "identity":
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            yield memoryview(chunk)
+        return
+
+    buffer = memoryview(bytearray(chunk_size))
+    while True:
+        size = response.raw.readinto(buffer)
+        if not size:
+            break
+        yield buffer[:size]
+
+
+def request_download(package: Package, partial_file: str) -> Tuple[requests.Response, int]:
+    """
+    Starts downloading the package, resuming an interrupted download where possible. A partial download
+    is resumed with a Range request when it was made from the same URL and either the server provided a
+    validator for it (sent as If-Range, so a changed file is downloaded from scratch) or the recipe
+    provides a checksum that will catch a corrupted result.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        partial_file (str): The path where the download is stored while it is in progress. Its state is
+            kept in a sidecar JSON file with the same name followed by ".json".
+
+    Returns:
+        Tuple[requests.Response, int]: The streaming response and the offset in partial_file at which
+        its body starts, 0 if the download starts from the beginning.
+    """
+    state = read_json_file(partial_file + ".json")
+    resume_from = 0
+    headers = {}
+    if state and state.get("url") == package.location and os.path.exists(partial_file):
+        validator = state.get("etag") or state.get("last_modified")
+        if validator or package.checksum:
+            resume_from = os.path.getsize(partial_file)
+        if resume_from:
+            headers["Range"] = f"bytes={resume_from}-"
+            if validator:
+                headers["If-Range"] = validator
+
+    response = get_session().get(package.location, headers=headers, stream=True)
+    if resume_from and response.status_code == 206:
+        if response.headers.get("Content-Range", "").startswith(f"bytes {resume_from}-"):
+            return response, resume_from
+    if resume_from and response.status_code != 200:
+        # The server rejected the range or answered with a different one; start over
+        response.close()
+        response = get_session().get(package.location, stream=True)
+
+    response.raise_for_status()
+    return response, 0
+
+
+def stream_download(package: Package, response: requests.Response, resume_from: int, partial_file: str,
+                    logger: logging.Logger) -> "hashlib._Hash":
+    """
+    Streams a download started by request_download into the partial file, hashing it on the way.
+    The partial file and its sidecar state file are kept if the transfer is interrupted, so that the
+    next attempt can resume it; the sidecar is removed once the download is complete.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        response (requests.Response): The streaming response returned by request_download.
+        resume_from (int): The offset in partial_file at which the response body starts.
+        partial_file (str): The path of the partial download.
+        logger (logging.Logger): A logger instance for logging messages during the download.
+
+    Returns:
+        hashlib._Hash: The SHA-256 hash of the complete file.
+    """
+    import hashlib
+
+    write_json_file(partial_file + ".json", {
+        "url": package.location,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    })
+
+    # The checksum is computed while the package streams to disk, so verifying it needs
+    # neither a second pass over the file nor memory proportional to its size
+    chunk_size = package.chunk_size or settings.chunk_size
+    file_hash = hashlib.sha256()
+    with open(partial_file, "r+b" if resume_from else "wb", buffering=chunk_size) as file:
+        if resume_from:
+            # Hash objects cannot be persisted, so the hash state is rebuilt from the bytes
+            # already on disk, which is far cheaper than downloading them again
+            logger.info(f"Resuming download of package '{package.name}' at byte {resume_from}")
+            file.truncate(resume_from)
+            for block in iter(lambda: file.read(1024 ** 2), b""):
+                file_hash.update(block)
+        for chunk in iter_response_chunks(response, chunk_size):
+            file_hash.update(chunk)
+            file.write(chunk)
+
+    os.remove(partial_file + ".json")
+    return file_hash
+
+
+def probe_segmented_download(package: Package) -> Optional[requests.Response]:
+    """
+    Checks with a HEAD request whether the package can be downloaded in segments, which requires the
+    server to advertise byte range support and the size of the file.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+
+    Returns:
+        Optional[requests.Response]: The response to the HEAD request, after following redirects, or None
+        if the package has to be downloaded as a single stream.
+    """
+    import requests
+
+    try:
+        response = get_session().head(package.location, allow_redirects=True)
+    except requests.RequestException:
+        return None
+    size = int(response.headers.get("Content-Length") or 0)
+    if (not response.ok or response.headers.get("Accept-Ranges", "").lower() != "bytes"
+            or size < settings.download_segments * 1024 ** 2):
+        return None
+    return response
+
+
+def segmented_download(package: Package, ranges: requests.Response, package_file: str,
+                       logger: logging.Logger) -> "hashlib._Hash":
+    """
+    Downloads the package as settings.download_segments byte ranges fetched on parallel connections,
+    each written at its offset into a file preallocated to the full size.
+
+    Segments arrive out of order, so unlike stream_download the file is hashed in one sequential pass
+    once it is complete.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        ranges (requests.Response): The response returned by probe_segmented_download.
+        package_file (str): The path the package is downloaded to.
+        logger (logging.Logger): A logger instance for logging messages during the download.
+
+    Returns:
+        hashlib._Hash: The SHA-256 hash of the complete file.
+
+    Raises:
+        ValueError: If the server does not answer a range request with the requested range.
+    """
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    url = ranges.url
+    size = int(ranges.headers["Content-Length"])
+    validator = ranges.headers.get("ETag") or ranges.headers.get("Last-Modified")
+    segment_size = -(-size // settings.download_segments)
+    chunk_size = package.chunk_size or settings.chunk_size
+    logger.info(f"Downloading package '{package.name}' in {settings.download_segments} segments")
+
+    with open(package_file, "wb") as file:
+        file.truncate(size)
+
+    def download_segment(start: int) -> None:
+        end = min(start + segment_size, size) - 1
+        headers = {"Range": f"bytes={start}-{end}"}
+        if validator:
+            headers["If-Range"] = validator
+        with get_session().get(url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code != 206 or not response.headers.get("Content-Range", "").startswith(f"bytes {start}-{end}/"):
+                raise ValueError(f"Server did not honour the range request for package '{package.name}'")
+            with open(package_file, "r+b", buffering=chunk_size) as file:
+                file.seek(start)
+                for chunk in iter_response_chunks(response, chunk_size):
+                    file.write(chunk)
+
+    try:
+        with ThreadPoolExecutor(max_workers=settings.download_segments) as executor:
+            for future in [executor.submit(download_segment, start) for start in range(0, size, segment_size)]:
+                future.result()
+    except Exception:
+        os.remove(package_file)
+        raise
+
+    file_hash = hashlib.sha256()
+    with open(package_file, "rb") as file:
+        for block in iter(lambda: file.read(1024 ** 2), b""):
+            file_hash.update(block)
+    return file_hash
+
+
+def download_lock(location: str) -> threading.Lock:
+    """
+    Returns the lock serializing downloads from the given location.
+
+    Arguments:
+        location (str): The URL of the download.
+
+    Returns:
+        threading.Lock: The lock of the location.
+    """
+    with session_lock:
+        return download_locks.setdefault(location, threading.Lock())
+
+
+def async_download_lock(location: str) -> asyncio.Lock:
+    """
+    The asyncio counterpart of download_lock, returning the lock serializing downloads from the given
+    location on the running event loop.
+
+    Arguments:
+        location (str): The URL of the download.
+
+    Returns:
+        asyncio.Lock: The lock of the location.
+    """
+    import asyncio
+
+    locks = async_download_locks.setdefault(asyncio.get_running_loop(), {})
+    return locks.setdefault(location, asyncio.Lock())
+
+
+def download_and_verify_package(package, logger) -> str:
+    """
+    Downloads the package from the specified location, verifies the checksum (if provided),
+    and extracts the package if it's an archive, see extract_download. See download_artifact for how the
+    package is downloaded.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the download and verification process.
+
+    Returns:
+        str: The path to the downloaded package file or the extracted directory.
+
+    Raises:
+        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+    """
+    package_file = download_artifact(package, logger, extract=True)
+    if os.path.isdir(package_file):
+        return package_file
+    return extract_download(package, package_file)
+
+
+def download_artifact(package: Package, logger: logging.Logger, extract: bool = False) -> str:
+    """
+    Downloads the package file from the specified location, or from the mirror when settings.mirror
+    is set, and verifies its checksum (if provided).
+
+    Downloads are kept in a size-bounded artifact cache so that installing the same artifact again
+    skips the download. Artifacts are keyed by their SHA-256 checksum when the recipe provides one,
+    which is looked up before any request is made, and otherwise by their URL and ETag, which are
+    known as soon as the response headers arrive. Interrupted downloads are kept and resumed by the
+    next attempt, see request_download. With settings.download_segments above 1, packages served with
+    byte range support are downloaded over parallel connections instead, see segmented_download.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the download and verification process.
+        extract (bool): Whether a tar package that is downloaded from the beginning over a single stream
+            is extracted while it downloads, see stream_extract_download.
+
+    Returns:
+        str: The path to the downloaded package file, or to the extracted directory if the package was
+        extracted while downloading. The caller owns the file or directory and removes it when done.
+
+    Raises:
+        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+    """
+    import hashlib
+
+    suffix = archive_suffix(package.location)
+    package = mirrored_package(package)
+    suffix = suffix or archive_suffix(package.location)
+    if not is_url(package.location):
+        return copy_local_artifact(package, logger, suffix)
+
+    # Packages sharing a location are downloaded one at a time, so that they do not write to the same
+    # partial file and the later ones find the artifact in the cache
+    with download_lock(package.location):
+        cache_key = package.checksum.lower() if package.checksum else None
+        package_file = checkout_cached_artifact(cache_key, suffix)
+        if package_file is not None:
+            logger.info(f"Using cached download of package '{package.name}'")
+        else:
+            # Download the package
+            logger.info(f"Downloading package '{package.name}'")
+            response = None
+            ranges = probe_segmented_download(package) if settings.download_segments > 1 else None
+            if ranges is None:
+                partial_file = os.path.join(settings.cache_dir, "partial", hashlib.sha256(package.location.encode()).hexdigest())
+                response, resume_from = request_download(package, partial_file)
+            headers = (ranges if ranges is not None else response).headers
+            final_location = (ranges if ranges is not None else response).url
+
+            # The URL the download was redirected to names the file where the recipe URL does not
+            suffix = suffix or archive_suffix(package.location, headers, final_location)
+            if cache_key is None and headers.get("ETag"):
+                cache_key = etag_cache_key(package, headers["ETag"])
+                package_file = checkout_cached_artifact(cache_key, suffix)
+
+            if package_file is not None:
+                logger.info(f"Using cached download of package '{package.name}'")
+                if response is not None:
+                    response.close()
+            elif (extract and package.extract is not False and response is not None and not resume_from
+                  and suffix in tar_stream_modes):
+                package_file = stream_extract_download(package, response, suffix, cache_key, partial_file, logger)
+            else:
+                package_file = new_checkout_file(suffix)
+                if ranges is not None:
+                    file_hash = segmented_download(package, ranges, package_file, logger)
+                else:
+                    file_hash = stream_download(package, response, resume_from, partial_file, logger)
+                    os.replace(partial_file, package_file)
+
+                verify_download(package, package_file, file_hash, cache_key, logger)
+
+    return package_file
+
+
+def is_url(location: str) -> bool:
+    """
+    Tells whether a package location or mirror is an HTTP(S) URL rather than a local path.
+
+    Arguments:
+        location (str): The location to check.
+
+    Returns:
+        bool: True if the location is an HTTP(S) URL.
+    """
+    return location.startswith(("http://", "https://"))
+
+
+def mirror_artifact_name(package: Package) -> str:
+    """
+    Returns the name of a package's artifact in a mirror: its SHA-256 checksum when the recipe
+    provides one, and otherwise the SHA-256 hash of its upstream location. The artifact file is named
+    by the name followed by the suffix of the download, see load_mirror_artifacts.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+
+    Returns:
+        str: The name of the artifact in the artifacts directory of a mirror.
+    """
+    import hashlib
+
+    if package.checksum:
+        return package.checksum.lower()
+    return hashlib.sha256(package.location.encode()).hexdigest()
+
+
+def load_mirror_artifacts() -> Dict[str, str]:
+    """
+    Fetches the file names of the artifacts of the mirror, once per run. The mirror action lists them
+    in the recipes directory of the mirror, because the suffix of an artifact, such as the ".exe" that
+    Windows needs to run an installer, may only be known from the upstream response it was downloaded
+    with.
+
+    Returns:
+        Dict[str, str]: The artifact file names keyed by mirror_artifact_name, empty if the mirror does
+        not list them.
+    """
+    global mirror_artifacts
+    with mirror_artifacts_lock:
+        if mirror_artifacts is None:
+            artifacts_json = fetch_repository_file(mirror_artifacts_name)
+            mirror_artifacts = json.loads(artifacts_json) if artifacts_json is not None else {}
+        return mirror_artifacts
+
+
+def mirrored_package(package: Package) -> Package:
+    """
+    Points a package at its artifact in the mirror when settings.mirror is set, see
+    load_mirror_artifacts.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+
+    Returns:
+        Package: A copy of the package whose location is in the mirror, or the package itself if no
+        mirror is set.
+    """
+    if not settings.mirror:
+        return package
+    artifact_name = mirror_artifact_name(package)
+    artifact_file = load_mirror_artifacts().get(artifact_name, artifact_name)
+    if is_url(settings.mirror):
+        location = f"{settings.mirror.rstrip('/')}/artifacts/{artifact_file}"
+    else:
+        location = os.path.join(settings.mirror, "artifacts", artifact_file)
+    return dataclasses.replace(package, location=location)
+
+
+def copy_local_artifact(package: Package, logger: logging.Logger, suffix: str = "") -> str:
+    """
+    Checks out a package file from a local mirror directory, hard linking it when possible and copying
+    it otherwise, and verifies its checksum (if provided).
+
+    Arguments:
+        package (Package): The package, as returned by mirrored_package for a local mirror.
+        logger (logging.Logger): A logger instance for logging messages during the copy and verification process.
+        suffix (str): The suffix of the checked out file name, such as ".tar.gz".
+
+    Returns:
+        str: The path to the checked out package file. The caller owns the file and removes it when done.
+
+    Raises:
+        ValueError: If the package is not in the mirror or its checksum doesn't match.
+    """
+    import hashlib
+
+    if not os.path.isfile(package.location):
+        raise ValueError(f"Package '{package.name}' is not available in mirror '{settings.mirror}'")
+
+    logger.info(f"Copying package '{package.name}' from mirror")
+    package_file = new_checkout_file(suffix)
+    try:
+        os.link(package.location, package_file)
+    except OSError:
+        shutil.copyfile(package.location, package_file)
+
+    file_hash = hashlib.sha256()
+    if package.checksum:
+        with open(package_file, "rb") as file:
+            for block in iter(lambda: file.read(settings.chunk_size), b""):
+                file_hash.update(block)
+    verify_download(package, package_file, file_hash, None, logger)
+    return package_file
+
+
+class DownloadReader(io.RawIOBase):
+    """
+    A read-only file object over the body of a streaming download, which hashes the bytes as they are
+    read and optionally copies them to a file, so that the download can be consumed by tarfile in
+    stream mode without being stored first.
+    """
+
+    def __init__(self, chunks, file_hash: "hashlib._Hash", copy_file=None):
+        self.chunks = chunks
+        self.file_hash = file_hash
+        self.copy_file = copy_file
+        self.pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.pending:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.file_hash.update(chunk)
+            if self.copy_file is not None:
+                self.copy_file.write(chunk)
+            self.pending = memoryview(bytes(chunk))
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def extract_tar(tar_ref: tarfile.TarFile, extract_dir: str,
+                members: Optional[List[tarfile.TarInfo]] = None) -> None:
+    """
+    Extracts a tar archive, refusing members that would be written outside extract_dir on Python
+    versions that support extraction filters.
+
+    Arguments:
+        tar_ref (tarfile.TarFile): The open tar archive.
+        extract_dir (str): The directory to extract the archive into.
+        members (Optional[List[tarfile.TarInfo]]): The members to extract, all of them if None.
+    """
+    import tarfile
+
+    if hasattr(tarfile, "data_filter"):
+        tar_ref.extractall(extract_dir, members, filter="data")
+    else:
+        tar_ref.extractall(extract_dir, members)
+
+
+tar_stream_modes = {".tar": "r|", ".tar.gz": "r|gz", ".tar.bz2": "r|bz2", ".tar.xz": "r|xz"}
+
+
+def stream_extract_download(package: Package, response: requests.Response, suffix: str, cache_key: Optional[str],
+                            partial_file: str, logger: logging.Logger) -> str:
+    """
+    Extracts a tar package, compressed in one of the tar_stream_modes formats, while it downloads,
+    hashing the same stream, so that the archive is neither written to disk nor read back before
+    extraction. When the artifact can be cached, the stream is also written to the partial file, as by
+    stream_download, so that the complete file is added to the artifact cache and an interrupted
+    download is resumed by the next attempt (which extracts it once it is complete, see
+    extract_download). Otherwise an interrupted download starts over.
+
+    The checksum can only be verified once the whole stream has been read, so the archive is extracted
+    into a private directory that is removed again if the checksum does not match.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        response (requests.Response): The streaming response of the download, started at its first byte.
+        suffix (str): The suffix of the archive format, see tar_stream_modes.
+        cache_key (Optional[str]): The artifact cache key of the download, None if it cannot be cached.
+        partial_file (str): The path of the partial download, see request_download.
+        logger (logging.Logger): A logger instance for logging messages during the download and extraction.
+
+    Returns:
+        str: The path to the extracted directory.
+
+    Raises:
+        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+        tarfile.TarError: If the download is not a valid tar archive.
+    """
+    import hashlib
+    import tarfile
+
+    logger.info(f"Extracting package '{package.name}' while downloading")
+    cacheable = (cache_key is not None and settings.artifact_cache_size > 0
+                 and int(response.headers.get("Content-Length") or 0) <= settings.artifact_cache_size)
+    if cacheable:
+        write_json_file(partial_file + ".json", {
+            "url": package.location,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        })
+    extract_dir = new_checkout_file()
+    chunk_size = package.chunk_size or settings.chunk_size
+    file_hash = hashlib.sha256()
+    try:
+        with open(partial_file, "wb", buffering=chunk_size) if cacheable else contextlib.nullcontext() as copy:
+            reader = DownloadReader(iter_response_chunks(response, chunk_size), file_hash, copy)
+            with tarfile.open(fileobj=reader, mode=tar_stream_modes[suffix]) as tar_ref:
+                extract_tar(tar_ref, extract_dir)
+            # Hash whatever follows the end of the archive as well
+            while reader.read(chunk_size):
+                pass
+
+        if package.checksum:
+            logger.info(f"Verifying checksum for package '{package.name}'")
+            if file_hash.hexdigest() != package.checksum.lower():
+                raise ValueError(f"Checksum mismatch for package '{package.name}'")
+    except Exception as e:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        # A transfer error keeps the partial file for the next attempt to resume, a bad download does not
+        if cacheable and isinstance(e, (ValueError, tarfile.TarError)):
+            os.remove(partial_file)
+            os.remove(partial_file + ".json")
+        raise
+
+    if not cacheable:
+        return extract_dir
+    os.remove(partial_file + ".json")
+    package_file = new_checkout_file(suffix)
+    os.replace(partial_file, package_file)
+    store_cached_artifact(cache_key, package_file)
+    os.remove(package_file)
+    return extract_dir
+
+
+def etag_cache_key(package: Package, etag: str) -> str:
+    """
+    Computes the artifact cache key of a package without a checksum from its URL and the ETag the
+    server reported for it.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        etag (str): The ETag header of the download response.
+
+    Returns:
+        str: The artifact cache key.
+    """
+    import hashlib
+
+    return hashlib.sha256(f"{package.location}\n{etag}".encode()).hexdigest()
+
+
+def new_checkout_file(suffix: str = "") -> str:
+    """
+    Returns a new path for a finished download. Finished downloads are placed next to the artifact
+    cache so that they can be hard linked into it.
+
+    Arguments:
+        suffix (str): The suffix of the file name, such as ".tar.gz".
+
+    Returns:
+        str: The path of a file that does not exist yet.
+    """
+    import uuid
+
+    checkout_dir = os.path.join(settings.cache_dir, "checkouts")
+    os.makedirs(checkout_dir, exist_ok=True)
+    return os.path.join(checkout_dir, uuid.uuid4().hex + suffix)
+
+
+archive_names = {
+    ".zip": ".zip",
+    ".tar": ".tar",
+    ".tar.gz": ".tar.gz", ".tgz": ".tar.gz",
+    ".tar.bz2": ".tar.bz2", ".tbz2": ".tar.bz2", ".tbz": ".tar.bz2",
+    ".tar.xz": ".tar.xz", ".txz": ".tar.xz",
+    ".tar.zst": ".tar.zst", ".tzst": ".tar.zst",
+}
+archive_content_types = {
+    "application/zip": ".zip", "application/x-zip-compressed": ".zip",
+    "application/x-tar": ".tar",
+    "application/gzip": ".tar.gz", "application/x-gzip": ".tar.gz", "application/x-compressed-tar": ".tar.gz",
+    "application/x-bzip2": ".tar.bz2", "application/x-bzip-compressed-tar": ".tar.bz2",
+    "application/x-xz": ".tar.xz", "application/x-xz-compressed-tar": ".tar.xz",
+    "application/zstd": ".tar.zst", "application/x-zstd-compressed-tar": ".tar.zst",
+}
+archive_magic = [
+    (0, b"PK\x03\x04", ".zip"),
+    (0, b"\x1f\x8b", ".tar.gz"),
+    (0, b"BZh", ".tar.bz2"),
+    (0, b"\xfd7zXZ\x00", ".tar.xz"),
+    (0, b"\x28\xb5\x2f\xfd", ".tar.zst"),
+    (257, b"ustar", ".tar"),
+]
+# Installers and packages that are installed as files and keep their extension, although many of them
+# are zip files themselves
+installer_extensions = ['.exe', '.msi', '.dmg', '.pkg', '.msix', '.msixbundle', '.appx', '.appxbundle',
+                        '.jar', '.war', '.whl', '.nupkg', '.vsix', '.xpi', '.apk']
+
+
+def archive_suffix(location: str, headers: Optional[dict] = None, final_location: Optional[str] = None) -> str:
+    """
+    Recognizes archive downloads from the file name in their Content-Disposition header or URL, or
+    from their Content-Type, so that they can be named and extracted accordingly. Installers keep
+    their extension, which Windows needs to run them.
+
+    Arguments:
+        location (str): The URL of the download.
+        headers (Optional[dict]): The response headers of the download, if already known.
+        final_location (Optional[str]): The URL the download was redirected to, if already known.
+
+    Returns:
+        str: The suffix of the archive format (see archive_names) or installer type, otherwise an empty string.
+    """
+    import re
+
+    headers = headers or {}
+    file_names = [str(url).split("?")[0].lower() for url in (final_location, location) if url]
+    disposition = re.search(r"filename\*?=(?:[\w-]+'[\w-]*')?\"?([^\";]+)", headers.get("Content-Disposition", ""),
+                            re.IGNORECASE)
+    if disposition:
+        file_names.insert(0, disposition.group(1).strip().lower())
+    for file_name in file_names:
+        for name_suffix, suffix in archive_names.items():
+            if file_name.endswith(name_suffix):
+                return suffix
+        extension = os.path.splitext(file_name)[-1]
+        if extension in installer_extensions:
+            return extension
+    content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+    return archive_content_types.get(content_type, "")
+
+
+def sniff_archive_suffix(package_file: str) -> Optional[str]:
+    """
+    Recognizes the archive format of a file from its magic bytes, regardless of its name. Many
+    installers and packages are zip files too, so the format is only sniffed once the file is known to
+    be an archive, to tell which one it is.
+
+    Arguments:
+        package_file (str): The path of the file.
+
+    Returns:
+        Optional[str]: The suffix of the archive format, see archive_names, or None if the file is not an archive.
+    """
+    with open(package_file, "rb") as file:
+        head = file.read(262)
+    for offset, magic, suffix in archive_magic:
+        if head[offset:offset + len(magic)] == magic:
+            return suffix
+    return None
+
+
+# Multi-threaded decompressors, in order of preference, which are used when they are installed
+decompressor_commands = {
+    ".tar.gz": [["pigz", "-dc"]],
+    ".tar.bz2": [["lbzip2", "-dc"], ["pbzip2", "-dc"]],
+    ".tar.xz": [["xz", "-dc", "-T0"]],
+    ".tar.zst": [["zstd", "-dc", "-T0"]],
+}
+
+
+@contextlib.contextmanager
+def decompressed_stream(package_file: str, suffix: str):
+    """
+    Opens the decompressed content of a compressed tar archive as a binary stream. An installed
+    multi-threaded decompressor from decompressor_commands is preferred, which also decompresses in
+    parallel with the extraction. The standard library is used otherwise, and the zstandard module for
+    zstd, which has no standard library decompressor.
+
+    Arguments:
+        package_file (str): The path to the compressed archive.
+        suffix (str): The suffix of the archive format, see archive_names.
+
+    Yields:
+        The decompressed stream, to be read to its end.
+
+    Raises:
+        ValueError: If the decompressor fails, or no decompressor is available for the format.
+    """
+    import bz2
+    import gzip
+    import lzma
+    import subprocess
+
+    command = next((command for command in decompressor_commands.get(suffix, []) if shutil.which(command[0])), None)
+    if command is not None:
+        with open(package_file, "rb") as source:
+            process = subprocess.Popen(command, stdin=source, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            yield process.stdout
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise ValueError(f"{command[0]} failed to decompress '{package_file}'")
+    elif suffix == ".tar":
+        with open(package_file, "rb") as stream:
+            yield stream
+    elif suffix == ".tar.gz":
+        with gzip.open(package_file) as stream:
+            yield stream
+    elif suffix == ".tar.bz2":
+        with bz2.open(package_file) as stream:
+            yield stream
+    elif suffix == ".tar.xz":
+        with lzma.open(package_file) as stream:
+            yield stream
+    elif suffix == ".tar.zst" and (zstandard := optional_import("zstandard")) is not None:
+        with open(package_file, "rb") as source, zstandard.ZstdDecompressor().stream_reader(source) as stream:
+            yield stream
+    else:
+        raise ValueError(f"No decompressor available for '{package_file}', install zstd or the zstandard module")
+
+
+def extract_archive(package_file: str, extract_dir: str, suffix: str,
+                    member_pattern: Optional[str] = None) -> List[str]:
+    """
+    Extracts an archive of a format recognized by sniff_archive_suffix. Zip archives are extracted with
+    extract_zip, tar archives are decompressed by decompressed_stream and extracted as a stream.
+
+    Arguments:
+        package_file (str): The path to the archive.
+        extract_dir (str): The directory to extract the archive into.
+        suffix (str): The suffix of the archive format, see archive_names.
+        member_pattern (Optional[str]): Only extract the members matching this path or glob pattern, see
+            select_members.
+
+    Returns:
+        List[str]: The names of the extracted members, directories ending with a slash, so that they
+        need not be listed from the archive again.
+
+    Raises:
+        tarfile.ReadError: If the decompressed file is not a tar archive.
+        ValueError: If no member matches member_pattern, or the archive cannot be decompressed.
+    """
+    import tarfile
+
+    if suffix == ".zip":
+        return extract_zip(package_file, extract_dir, member_pattern=member_pattern)
+
+    matched = []
+    with decompressed_stream(package_file, suffix) as stream:
+        with tarfile.open(fileobj=stream, mode="r|") as tar_ref:
+            def matching_members():
+                for member in tar_ref:
+                    if member_pattern is None or member_matches(member.name, member_pattern):
+                        matched.append(member.name + "/" if member.isdir() else member.name)
+                        yield member
+
+            extract_tar(tar_ref, extract_dir, matching_members())
+        # Read up to the end of the stream, so that the decompressor can check its integrity
+        while stream.read(1024 ** 2):
+            pass
+    if member_pattern is not None and not matched:
+        raise ValueError(f"No archive member matches '{member_pattern}'")
+    return matched
+
+
+def verify_download(package: Package, package_file: str, file_hash: "hashlib._Hash", cache_key: Optional[str],
+                    logger: logging.Logger) -> None:
+    """
+    Verifies the checksum of a finished download, if the recipe provides one, and adds the download
+    to the artifact cache.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        package_file (str): The path of the downloaded file.
+        file_hash (hashlib._Hash): The SHA-256 hash computed while downloading the file.
+        cache_key (Optional[str]): The artifact cache key of the download, None if it cannot be cached.
+        logger (logging.Logger): A logger instance for logging messages during the verification.
+
+    Raises:
+        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+    """
+    if package.checksum:
+        logger.info(f"Verifying checksum for package '{package.name}'")
+        if file_hash.hexdigest() != package.checksum.lower():
+            os.remove(package_file)
+            raise ValueError(f"Checksum mismatch for package '{package.name}'")
+
+    store_cached_artifact(cache_key, package_file)
+
+
+def extract_download(package: Package, package_file: str) -> str:
+    """
+    Extracts a downloaded package if it's an archive, removing the archive afterwards. Whether it is
+    an archive is decided by package.extract, or else by the suffix archive_suffix gave the download;
+    its format is then recognized from its content by sniff_archive_suffix.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        package_file (str): The path of the downloaded file, named with its suffix, see new_checkout_file.
+
+    Returns:
+        str: The path to the extracted directory, or package_file if it is not an archive.
+    """
+    import tarfile
+
+    suffix = archive_suffix(package_file)
+    if package.extract is False or (package.extract is None and suffix not in archive_names.values()):
+        return package_file
+    suffix = sniff_archive_suffix(package_file) or suffix
+    if suffix not in archive_names.values():
+        return package_file
+
+    extracted_dir = new_checkout_file()
+    try:
+        extract_archive(package_file, extracted_dir, suffix)
+    except tarfile.ReadError:
+        # A compressed file that is not a tar archive, such as some disk images, is installed as it is
+        shutil.rmtree(extracted_dir, ignore_errors=True)
+        return package_file
+    except Exception:
+        shutil.rmtree(extracted_dir, ignore_errors=True)
+        raise
+    os.remove(package_file)
+    return extracted_dir
+
+
+def run_script(script: str, logger: logging.Logger, **format_args)  -> None:
+    """
+    Runs a given script as a temporary shell script or PowerShell script, depending on the platform.
+
+    Arguments:
+        script (str): The script to be executed, either as a shell script or PowerShell script.
+        logger (logging.Logger): A logger instance for logging messages during the execution process.
+        **format_args: Keyword arguments to be passed to the script.format() method, for replacing placeholders in the script.
+
+    Raises:
+        subprocess.CalledProcessError: If the script execution fails.
+    """
+    import platform
+    import subprocess
+    import tempfile
+
+    is_windows = platform.system() == "Windows"
+    script_name = "script.ps1" if is_windows else "script.sh"
+
+    with tempfile.NamedTemporaryFile(mode="w", prefix="pkg_manager_", suffix=script_name, delete=False) as script_file:
+        script_file.write(script.format(**format_args))
+        script_file.flush()
+        script_file.seek(0)
+
+    try:
+        if is_windows:
+            result = subprocess.run(["powershell", "-ExecutionPolicy", "Unrestricted", "-File", script_file.name], check=True)
+            logger.debug(result.stdout)
+        else:
+            result = subprocess.run(["bash", script_file.name], check=True)
+            logger.debug(result.stdout)
+    
+    except subprocess.CalledProcessError as e:
+        logger.error(e.stderr)
+        raise
+
+    os.remove(script_file.name)
+
+
+
+def script_format_args(package_file: str) -> Dict[str, str]:
+    """
+    Returns the placeholders available to the scripts and copy paths of a recipe.
+
+    Arguments:
+        package_file (str): The path to the installer file or directory.
+
+    Returns:
+        Dict[str, str]: The keyword arguments for str.format.
+    """
+    return {
+        'package_file': package_file,
+        'user_path': user_path,
+        'system_path': system_path,
+        'system_path_x86': system_path_x86
+    }
+
+
+FICLONE = 0x40049409
+
+
+def clone_file(source: str, destination: str) -> bool:
+    """
+    Creates destination as a reflink of source, sharing its data blocks until either is modified, on
+    filesystems that support it (Btrfs, XFS, bcachefs).
+
+    Arguments:
+        source (str): The path of the file to clone.
+        destination (str): The path of the clone.
+
+    Returns:
+        bool: Whether the file was cloned. Nothing is left at destination if not.
+    """
+    fcntl = optional_import("fcntl")
+    if fcntl is None:
+        return False
+    try:
+        with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(destination)
+        return False
+    shutil.copystat(source, destination)
+    return True
+
+
+def copy_tree(source: str, destination: str, workers: Optional[int] = None) -> str:
+    """
+    Installs a file or directory tree at destination as cheaply as the filesystems allow. The source is
+    renamed into place when the destination does not exist yet and is on the same filesystem. Otherwise
+    the files are reflinked when the destination filesystem supports it, and copied with shutil.copy2 by
+    a pool of threads if not. Files of an existing destination directory are overwritten.
+
+    A source file with several hard links, such as a checkout of the artifact cache, is never renamed,
+    so that the installed file does not share the cached data.
+
+    Arguments:
+        source (str): The file or directory to install. It may be moved away.
+        destination (str): The path to install it at.
+        workers (Optional[int]): The number of copying threads, settings.extract_workers if None.
+
+    Returns:
+        str: How the tree was installed: "rename", "reflink" or "copy".
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    destination_parent = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(destination_parent, exist_ok=True)
+    source_stat = os.stat(source)
+    if (not os.path.lexists(destination) and source_stat.st_dev == os.stat(destination_parent).st_dev
+            and (os.path.isdir(source) or source_stat.st_nlink == 1)):
+        try:
+            os.rename(source, destination)
+            return "rename"
+        except OSError:
+            pass
+
+    if os.path.isdir(source):
+        files = []
+        for root, dirs, file_names in os.walk(source):
+            target_root = os.path.join(destination, os.path.relpath(root, source))
+            os.makedirs(target_root, exist_ok=True)
+            files.extend((os.path.join(root, name), os.path.join(target_root, name)) for name in file_names)
+    else:
+        files = [(source, destination)]
+    if not files:
+        return "copy"
+
+    # Whether the filesystems support reflinks is probed on the first file only
+    first_source, first_destination = files[0]
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(first_destination)
+    cloning = clone_file(first_source, first_destination)
+    if not cloning:
+        shutil.copy2(first_source, first_destination)
+
+    def copy_file(paths: Tuple[str, str]) -> None:
+        file_source, file_destination = paths
+        if cloning:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(file_destination)
+            if clone_file(file_source, file_destination):
+                return
+        shutil.copy2(file_source, file_destination)
+
+    with ThreadPoolExecutor(max_workers=workers or settings.extract_workers) as executor:
+        for future in [executor.submit(copy_file, paths) for paths in files[1:]]:
+            future.result()
+    return "reflink" if cloning else "copy"
+
+
+def copy_install(package: Package, package_file: str, logger: logging.Logger) -> None:
+    """
+    Installs a "cp" package natively by installing its copy_source at its copy_destination with
+    copy_tree, instead of running an install script that copies the files.
+
+    The whole copy_destination is recorded as installed by the package and removed when it is
+    uninstalled, so an existing copy_destination is only replaced if an installed version of the
+    package owns it, see owns_installed_path. Installing into a directory holding other files would
+    remove them along with the package.
+
+    Arguments:
+        package (Package): A Package instance with copy_destination set.
+        package_file (str): The path to the downloaded file or extracted directory.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+
+    Raises:
+        ValueError: If copy_source does not exist in the downloaded package, or copy_destination exists
+            and the package does not own it.
+    """
+    format_args = script_format_args(package_file)
+    source = package_file
+    if package.copy_source:
+        source = os.path.join(package_file, package.copy_source.format(**format_args))
+    if not os.path.exists(source):
+        raise ValueError(f"'{package.copy_source}' not found in '{package.location}'")
+    destination = package.copy_destination.format(**format_args)
+    if os.path.lexists(destination) and not owns_installed_path(package, destination):
+        raise ValueError(f"'{destination}' already exists and was not installed by package '{package.name}'; "
+                         f"remove it or choose a copy_destination of its own")
+
+    logger.info(f"Copying '{source}' to '{destination}'")
+    method = copy_tree(source, destination)
+    logger.debug(f"Installed '{destination}' by {method}")
+
+
+def run_install_scripts(package: Package, package_file: str, logger: logging.Logger) -> None:
+    """
+    Runs the pre-install, install and post-install scripts of a package. For "cp" packages with a
+    copy_destination, the package is installed with copy_install instead of the install script.
+
+    Arguments:
+        package (Package): A Package instance containing the package information and installation instructions.
+        package_file (str): The path to the installer file or directory, available to the scripts as {package_file}.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+
+    Raises:
+        subprocess.CalledProcessError: If the script execution fails during the installation process.
+    """
+    format_args = script_format_args(package_file)
+    if package.pre_install:
+        logger.info("Running pre-install script")
+        run_script(package.pre_install.format(**format_args), logger, **format_args)
+    if package.installer_type == "cp" and package.copy_destination:
+        copy_install(package, package_file, logger)
+    elif package.install:
+        logger.info("Running install script")
+        run_script(package.install.format(**format_args), logger, **format_args)
+    if package.post_install:
+        logger.info("Running post-install script")
+        run_script(package.post_install.format(**format_args), logger, **format_args)
+
+
+def run_uninstall_scripts(package: Package, paths: List[str], logger: logging.Logger) -> None:
+    """
+    Runs the pre-uninstall, uninstall and post-uninstall scripts of a package. For "cp" packages
+    without an uninstall script, the paths they installed are removed instead.
+
+    Arguments:
+        package (Package): The Package instance the package was installed from.
+        paths (List[str]): The paths the package installed, as recorded in the state database.
+        logger (logging.Logger): A logger instance for logging messages during the uninstallation process.
+
+    Raises:
+        subprocess.CalledProcessError: If the script execution fails during the uninstallation process.
+    """
+    format_args = script_format_args("")
+    if package.pre_uninstall:
+        logger.info("Running pre-uninstall script")
+        run_script(package.pre_uninstall.format(**format_args), logger, **format_args)
+    if package.uninstall:
+        logger.info("Running uninstall script")
+        run_script(package.uninstall.format(**format_args), logger, **format_args)
+    elif package.installer_type == "cp" and paths:
+        for path in paths:
+            logger.info(f"Removing '{path}'")
+            remove_path(path)
+    else:
+        logger.warning(f"Package '{package.name}' has no uninstall script, only its record is removed")
+    if package.post_uninstall:
+        logger.info("Running post-uninstall script")
+        run_script(package.post_uninstall.format(**format_args), logger, **format_args)
+
+
+def vendor_install(package: Package, logger: logging.Logger, package_file: Optional[str] = None) -> None:
+    """
+    Installs a software package using the vendor_install strategy, which downloads and runs the installer provided by the vendor.
+
+    Arguments:
+        package (Package): A Package instance containing the package information and installation instructions.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        package_file (Optional[str]): The already downloaded package, as returned by download_and_verify_package.
+            The package is downloaded if None. It is removed once the installation is done.
+
+    Raises:
+        ValueError: If the checksum of the downloaded package does not match the expected checksum.
+        subprocess.CalledProcessError: If the script execution fails during the installation process.
+    """
+    if package_file is None:
+        package_file = download_and_verify_package(package, logger)
+    try:
+        run_install_scripts(package, package_file, logger)
+    finally:
+        remove_path(package_file)
+
+binary_extensions = ['.exe', '.msi', '.dmg', '.pkg']
+
+
+def binary_rank(member: str) -> Optional[Tuple[int, int, str]]:
+    """
+    Ranks a path as an installer candidate. Shallower paths rank first, then the extensions in the
+    order of binary_extensions, then the names, so that the same archive always yields the same installer.
+
+    Arguments:
+        member (str): The path of the file relative to the archive or extraction root, using forward slashes.
+
+    Returns:
+        Optional[Tuple[int, int, str]]: The sort key of the path, or None if it is not an installer.
+    """
+    if member.startswith("./"):
+        member = member[2:]
+    extension = os.path.splitext(member)[-1].lower()
+    if member.endswith("/") or extension not in binary_extensions:
+        return None
+    return member.count("/"), binary_extensions.index(extension), member.lower()
+
+
+def find_binary_member(names: List[str]) -> Optional[str]:
+    """
+    Picks the installer from the member listing of an archive, see binary_rank.
+
+    Arguments:
+        names (List[str]): The member names listed by the archive.
+
+    Returns:
+        Optional[str]: The best ranked member name, or None if the archive has no installer.
+    """
+    ranked = [(rank, name) for name in names if (rank := binary_rank(name)) is not None]
+    return min(ranked)[1] if ranked else None
+
+
+def archive_member_names(package_file: str) -> Optional[List[str]]:
+    """
+    Lists the members of a zip archive without extracting it, reading nothing but its central
+    directory. Tar archives have no such index and would have to be decompressed again to be listed.
+
+    Arguments:
+        package_file (str): The path to the archive.
+
+    Returns:
+        Optional[List[str]]: The member names, or None if the file is not a readable zip archive.
+    """
+    import zipfile
+
+    try:
+        if zipfile.is_zipfile(package_file):
+            with zipfile.ZipFile(package_file) as zip_ref:
+                return zip_ref.namelist()
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return None
+
+
+def find_binary_file(root_dir) -> Optional[str]:
+    """
+    Searches for a binary file with one of the specified extensions (.exe, .msi, .dmg, .pkg)
+    starting from the root directory. The tree is scanned one level at a time and the search stops at
+    the first level containing an installer, which is picked as ranked by binary_rank.
+
+    Arguments:
+        root_dir (str): The root directory to start the search from.
+
+    Returns:
+        Optional[str]: The path to the binary file if found, otherwise None.
+    """
+    level = [(root_dir, "")]
+    while level:
+        candidates = []
+        next_level = []
+        for directory, relative_dir in level:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative_path = relative_dir + entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            next_level.append((entry.path, relative_path + "/"))
+                        elif (rank := binary_rank(relative_path)) is not None:
+                            candidates.append((rank, entry.path))
+            except OSError:
+                continue
+        if candidates:
+            return min(candidates)[1]
+        level = next_level
+    return None
+
+
+def locate_installer(package: Package, extract_dir: str, names: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Locates the installer of a zip_install package in the directory its archive was extracted into.
+    The installer is picked from the member listing of the archive, restricted to the members selected
+    by installer_member: the names collected while extracting it, or else the listing of a zip archive,
+    see archive_member_names. It is searched for with find_binary_file otherwise.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        extract_dir (str): The directory the package archive was extracted into.
+        names (Optional[List[str]]): The member names returned by extract_package, if known.
+
+    Returns:
+        Optional[str]: The path to the installer if found, otherwise None.
+    """
+    if names is None:
+        names = archive_member_names(package.location)
+    if names is not None:
+        if package.installer_member is not None:
+            names = select_members(names, package.installer_member)
+        member = find_binary_member(names)
+        if member is not None:
+            package_file = os.path.join(extract_dir, *member.split("/"))
+            if os.path.isfile(package_file):
+                return package_file
+    return find_binary_file(extract_dir)
+
+def select_members(names: List[str], pattern: str) -> List[str]:
+    """
+    Selects the archive members matching a member path or glob pattern, as given by the
+    installer_member field of a recipe. A pattern naming a directory selects everything below it.
+
+    Arguments:
+        names (List[str]): The member names listed by the archive.
+        pattern (str): The member path or glob pattern, using forward slashes.
+
+    Returns:
+        List[str]: The matching member names, in archive order.
+
+    Raises:
+        ValueError: If no member matches the pattern.
+    """
+    selected = [name for name in names if member_matches(name, pattern)]
+    if not selected:
+        raise ValueError(f"No archive member matches '{pattern}'")
+    return selected
+
+
+def member_matches(name: str, pattern: str) -> bool:
+    """
+    Tells whether an archive member matches a member path or glob pattern, see select_members.
+
+    Arguments:
+        name (str): The member name.
+        pattern (str): The member path or glob pattern.
+
+    Returns:
+        bool: Whether the member matches.
+    """
+    import fnmatch
+
+    pattern = pattern.replace("\\", "/").strip("/")
+    name = name[2:] if name.startswith("./") else name
+    return fnmatch.fnmatchcase(name.rstrip("/"), pattern) or fnmatch.fnmatchcase(name, pattern + "/*")
+
+
+def extract_zip(package_file: str, extract_dir: str, workers: Optional[int] = None,
+                member_pattern: Optional[str] = None) -> List[str]:
+    """
+    Extracts a zip archive by distributing its members over a pool of worker threads, each reading the
+    archive through its own file handle. zlib releases the GIL while decompressing, so archives with
+    many members are extracted on several cores. Members are balanced between workers by size.
+
+    Arguments:
+        package_file (str): The path to the zip archive.
+        extract_dir (str): The directory to extract the archive into.
+        workers (Optional[int]): The number of worker threads, settings.extract_workers if None.
+        member_pattern (Optional[str]): Only extract the members matching this path or glob pattern, see
+            select_members. Nothing but the central directory is read for the other members.
+
+    Returns:
+        List[str]: The names of the extracted members.
+
+    Raises:
+        ValueError: If a member would be written outside extract_dir, or no member matches member_pattern.
+    """
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    root = os.path.realpath(extract_dir)
+    with zipfile.ZipFile(package_file) as zip_ref:
+        members = zip_ref.infolist()
+    if member_pattern is not None:
+        selected = set(select_members([info.filename for info in members], member_pattern))
+        members = [info for info in members if info.filename in selected]
+
+    files = []
+    directories = {root}
+    for info in members:
+        target = os.path.normpath(os.path.join(root, info.filename))
+        if os.path.commonpath([root, target]) != root:
+            raise ValueError(f"Archive member '{info.filename}' would be extracted outside of '{extract_dir}'")
+        if info.is_dir():
+            directories.add(target)
+        else:
+            directories.add(os.path.dirname(target))
+            files.append((info, target))
+
+    # Directories are created up front so that workers never race on them
+    for directory in sorted(directories):
+        os.makedirs(directory, exist_ok=True)
+
+    batches = [[] for _ in range(max(1, min(workers or settings.extract_workers, len(files))))]
+    batch_sizes = [0] * len(batches)
+    for info, target in sorted(files, key=lambda member: member[0].file_size, reverse=True):
+        lightest = batch_sizes.index(min(batch_sizes))
+        batches[lightest].append((info, target))
+        # Every member costs a file creation on top of its size
+        batch_sizes[lightest] += info.file_size + 4096
+
+    def extract_batch(batch: list) -> None:
+        with zipfile.ZipFile(package_file) as zip_ref:
+            for info, target in batch:
+                with zip_ref.open(info) as source, open(target, "wb") as destination:
+                    shutil.copyfileobj(source, destination)
+
+    if len(batches) == 1:
+        extract_batch(batches[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+            for future in [executor.submit(extract_batch, batch) for batch in batches]:
+                future.result()
+    return [info.filename for info in members]
+
+
+def extract_package(package_file: str, extract_dir: str, member_pattern: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Extracts the given package archive file into the specified directory.
+    Supports .zip, .tar, .tar.gz, .tar.bz2, .tar.xz and .tar.zst archives, recognized from their content,
+    see extract_archive.
+
+    Arguments:
+        package_file (str): The path to the package archive file.
+        extract_dir (str): The directory to extract the contents of the package file into.
+        member_pattern (Optional[str]): Only extract the members matching this path or glob pattern, see
+            select_members.
+
+    Returns:
+        Optional[List[str]]: The names of the extracted members, see extract_archive, or None if the
+        archive was extracted by shutil.unpack_archive.
+    """
+    suffix = sniff_archive_suffix(package_file)
+    if suffix is not None:
+        return extract_archive(package_file, extract_dir, suffix, member_pattern)
+    shutil.unpack_archive(package_file, extract_dir)
+    return None
+
+
+
+def zip_install(package: Package, logger: logging.Logger, extract_dir: Optional[str] = None) -> None:
+    """
+    Installs a software package using the zip_install strategy.
+    The package is expected to be in a .zip archive. The function extracts the archive,
+    finds the binary installer file, and runs the pre-install, install, and post-install scripts.
+
+    Arguments:
+        package (Package): The Package object containing the package information.
+        logger (logging.Logger): The logger object for logging events during the installation process.
+        extract_dir (Optional[str]): A directory the archive has already been extracted into, as returned
+            by prepare_package. The archive is extracted if None. It is removed once the installation is done.
+    """
+    import tempfile
+
+    extracted = extract_dir is not None
+    extract_dir = extract_dir or tempfile.mkdtemp()
+    try:
+        # Extract the package zip file to a temporary directory
+        names = None
+        if not extracted:
+            names = extract_package(package.location, extract_dir, package.installer_member)
+
+        # Find the binary installer file
+        package_file = locate_installer(package, extract_dir, names)
+
+        if not package_file:
+            raise ValueError(f"Installer file not found in '{package.location}'")
+
+        # Run pre-install, install, and post-install scripts
+        run_install_scripts(package, package_file, logger)
+    finally:
+        shutil.rmtree(extract_dir)
+
+
+async def async_download_and_verify_package(package: Package, logger: logging.Logger,
+                                           http: Optional["aiohttp.ClientSession"]) -> str:
+    """
+    The asyncio counterpart of download_and_verify_package. The artifact cache and the per-location
+    locking are used in the same way (see async_download_lock), the download streams through the event
+    loop with aiohttp, and disk work, verification and extraction run in worker threads. Downloads are
+    neither resumed nor segmented in this mode.
+
+    When aiohttp is not installed, download_and_verify_package runs in a worker thread instead.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the download and verification process.
+        http (Optional[aiohttp.ClientSession]): The aiohttp session of the run, None if aiohttp is not installed.
+
+    Returns:
+        str: The path to the downloaded package file or the extracted directory.
+
+    Raises:
+        ValueError: If the checksum provided doesn't match the calculated checksum of the downloaded file.
+    """
+    import asyncio
+    import hashlib
+
+    if http is None or (settings.mirror and not is_url(settings.mirror)):
+        return await asyncio.to_thread(download_and_verify_package, package, logger)
+    upstream_location = package.location
+    package = await asyncio.to_thread(mirrored_package, package)
+
+    # Disk work runs in worker threads, so that copying an artifact out of the cache or writing a
+    # download does not stall the event loop
+    async with async_download_lock(package.location):
+        cache_key = package.checksum.lower() if package.checksum else None
+        suffix = archive_suffix(upstream_location) or archive_suffix(package.location)
+        package_file = await asyncio.to_thread(checkout_cached_artifact, cache_key, suffix)
+        if package_file is not None:
+            logger.info(f"Using cached download of package '{package.name}'")
+        else:
+            logger.info(f"Downloading package '{package.name}'")
+            async with http.get(package.location) as response:
+                response.raise_for_status()
+                suffix = archive_suffix(upstream_location, response.headers, response.url)
+                if cache_key is None and response.headers.get("ETag"):
+                    cache_key = etag_cache_key(package, response.headers["ETag"])
+                    package_file = await asyncio.to_thread(checkout_cached_artifact, cache_key, suffix)
+
+                if package_file is not None:
+                    logger.info(f"Using cached download of package '{package.name}'")
+                else:
+                    package_file = new_checkout_file(suffix)
+                    file_hash = hashlib.sha256()
+                    chunk_size = package.chunk_size or settings.chunk_size
+                    file = await asyncio.to_thread(open, package_file, "wb", chunk_size)
+                    try:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            file_hash.update(chunk)
+                            await asyncio.to_thread(file.write, chunk)
+                    finally:
+                        await asyncio.to_thread(file.close)
+                    await asyncio.to_thread(verify_download, package, package_file, file_hash, cache_key, logger)
+
+    return await asyncio.to_thread(extract_download, package, package_file)
+
+
+async def async_run_script(script: str, logger: logging.Logger, **format_args) -> None:
+    """
+    The asyncio counterpart of run_script, running the script with asyncio.create_subprocess_exec so
+    that waiting for it does not block the event loop.
+
+    Arguments:
+        script (str): The script to be executed, either as a shell script or PowerShell script.
+        logger (logging.Logger): A logger instance for logging messages during the execution process.
+        **format_args: Keyword arguments to be passed to the script.format() method, for replacing placeholders in the script.
+
+    Raises:
+        subprocess.CalledProcessError: If the script execution fails.
+    """
+    import asyncio
+    import platform
+    import subprocess
+    import tempfile
+
+    is_windows = platform.system() == "Windows"
+    script_name = "script.ps1" if is_windows else "script.sh"
+
+    with tempfile.NamedTemporaryFile(mode="w", prefix="pkg_manager_", suffix=script_name, delete=False) as script_file:
+        script_file.write(script.format(**format_args))
+
+    if is_windows:
+        command = ["powershell", "-ExecutionPolicy", "Unrestricted", "-File", script_file.name]
+    else:
+        command = ["bash", script_file.name]
+    process = await asyncio.create_subprocess_exec(*command)
+    return_code = await process.wait()
+    if return_code != 0:
+        logger.error(f"Script exited with code {return_code}")
+        raise subprocess.CalledProcessError(return_code, command)
+
+    os.remove(script_file.name)
+
+
+async def async_run_install_scripts(package: Package, package_file: str, logger: logging.Logger) -> None:
+    """
+    Runs the pre-install, install and post-install scripts of a package with async_run_script.
+    copy_install runs in a worker thread.
+
+    Arguments:
+        package (Package): A Package instance containing the package information and installation instructions.
+        package_file (str): The path to the installer file or directory, available to the scripts as {package_file}.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+
+    Raises:
+        subprocess.CalledProcessError: If the script execution fails during the installation process.
+    """
+    import asyncio
+
+    format_args = script_format_args(package_file)
+    if package.pre_install:
+        logger.info("Running pre-install script")
+        await async_run_script(package.pre_install.format(**format_args), logger, **format_args)
+    if package.installer_type == "cp" and package.copy_destination:
+        await asyncio.to_thread(copy_install, package, package_file, logger)
+    elif package.install:
+        logger.info("Running install script")
+        await async_run_script(package.install.format(**format_args), logger, **format_args)
+    if package.post_install:
+        logger.info("Running post-install script")
+        await async_run_script(package.post_install.format(**format_args), logger, **format_args)
+
+
+async def async_prepare_package(package: Package, logger: logging.Logger,
+                                http: Optional["aiohttp.ClientSession"]) -> Optional[str]:
+    """
+    The asyncio counterpart of prepare_package.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the download.
+        http (Optional[aiohttp.ClientSession]): The aiohttp session of the run, None if aiohttp is not installed.
+
+    Returns:
+        Optional[str]: The prepared package to pass to async_install_single_package, or None if the
+        strategy has no download stage.
+
+    Raises:
+        Exception: If there is an error during the download or extraction.
+    """
+    import asyncio
+
+    if package.strategy != "vendor_install":
+        return await asyncio.to_thread(prepare_package, package, logger)
+
+    try:
+        return await async_download_and_verify_package(package, logger, http)
+    except Exception as e:
+        logger.error(f"Installation of '{package.name}' failed: {str(e)}")
+        raise
+
+
+async def async_install_single_package(package: Package, logger: logging.Logger, prepared: Optional[str]) -> None:
+    """
+    The asyncio counterpart of install_single_package, for a package whose download stage has already
+    run. The prepared package is removed once the installation is done.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        prepared (Optional[str]): The package as returned by async_prepare_package.
+
+    Raises:
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    import asyncio
+
+    try:
+        logger.info(f"Installing package '{package.name}'")
+        if package.strategy == "vendor_install":
+            await async_run_install_scripts(package, prepared, logger)
+        elif package.strategy == "zip_install":
+            package_file = await asyncio.to_thread(locate_installer, package, prepared)
+            if not package_file:
+                raise ValueError(f"Installer file not found in '{package.location}'")
+            await async_run_install_scripts(package, package_file, logger)
+        else:
+            raise ValueError(f"Unsupported installation strategy '{package.strategy}'")
+
+        logger.info(f"Installation of '{package.name}' completed successfully")
+
+    except Exception as e:
+        logger.error(f"Installation of '{package.name}' failed: {str(e)}")
+        raise
+
+    finally:
+        if prepared:
+            await asyncio.to_thread(remove_path, prepared)
+
+
+async def async_execute_install_plan(plan: Dict[str, Package], logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    The asyncio counterpart of execute_install_plan. Every package of the install plan is a task on the
+    running event loop that downloads the package, waits for the tasks of its dependencies and then
+    installs the package, so that downloads overlap with the installation of dependencies. As with
+    execute_install_plan, at most `jobs` packages are downloading or downloaded ahead of their
+    installation, and at most `jobs` packages are installed at any time. Downloads go
+    through one aiohttp session when aiohttp is installed, and install scripts run as asyncio subprocesses.
+    Installed packages are recorded in the state database as with execute_install_plan.
+
+    Arguments:
+        plan (Dict[str, Package]): The install plan as returned by resolve_install_plan.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+
+    Raises:
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    import asyncio
+    aiohttp = optional_import("aiohttp")
+
+    if not plan:
+        logger.info("All packages are already installed")
+        return
+    logger.info(f"Install plan: {', '.join(plan)}")
+
+    http = None
+    if aiohttp is not None:
+        http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=settings.http_pool_size))
+    download_semaphore = asyncio.Semaphore(jobs)
+    semaphore = asyncio.Semaphore(jobs)
+    failures = []
+    tasks = {}
+
+    async def install(name: str, planned: Package, dependencies: List[asyncio.Task]) -> None:
+        # A failed dependency fails its dependents; a failure anywhere else stops packages that have
+        # not started yet, while packages that are already being installed are allowed to finish.
+        # A package holds a download slot from the start of its download until its dependencies are
+        # installed, so that at most `jobs` packages are downloaded ahead of their installation. The
+        # tasks wait for slots in plan order, so dependencies always get theirs before their dependents.
+        await download_semaphore.acquire()
+        downloading = True
+        installing = False
+        prepared = None
+        try:
+            if failures:
+                return
+            try:
+                prepared = await async_prepare_package(planned, logger, http)
+            except Exception as e:
+                failures.append(e)
+                raise
+
+            await asyncio.gather(*dependencies)
+            download_semaphore.release()
+            downloading = False
+            async with semaphore:
+                if failures:
+                    return
+                installing = True
+                await async_install_single_package(planned, logger, prepared)
+            await asyncio.to_thread(record_installed_package, name, planned)
+        except Exception as e:
+            if installing:
+                failures.append(e)
+            raise
+        finally:
+            if downloading:
+                download_semaphore.release()
+            if not installing and prepared:
+                await asyncio.to_thread(remove_path, prepared)
+
+    try:
+        for name, planned in plan.items():
+            dependencies = [tasks[dependency_name] for dependency_name in planned.install_dependencies or []
+                            if dependency_name in tasks]
+            tasks[name] = asyncio.create_task(install(name, planned, dependencies))
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    finally:
+        if http is not None:
+            await http.close()
+
+    if failures:
+        raise failures[0]
+
+
+async def async_install_package(package: Package, logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    The asyncio counterpart of install_package, keying the package in the same way. Recipes are
+    resolved in a worker thread, then the plan is installed by async_execute_install_plan.
+
+    Arguments:
+        package (Package): An instance of the Package dataclass containing the parsed recipe data.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle.
+        ValueError: If the installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    import asyncio
+
+    name = package.recipe_name or package.name
+
+    def resolve() -> Dict[str, Package]:
+        return pending_install_plan(resolve_install_plan({name: package}), logger)
+
+    plan = await asyncio.to_thread(resolve)
+    try:
+        await async_execute_install_plan(plan, logger, jobs)
+    finally:
+        await asyncio.to_thread(mark_explicit_packages, [name])
+
+
+async def async_install_packages(package_names: List[str], logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    The asyncio counterpart of install_packages. Recipes are fetched and resolved in a worker thread,
+    then the combined plan is installed by async_execute_install_plan.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to install.
+        logger (logging.Logger): A logger instance for logging messages during the installation process.
+        jobs (int): The maximum number of packages to install concurrently.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle.
+        ValueError: If a recipe cannot be fetched or an installation strategy is not supported.
+        Exception: If there is an error during the installation process.
+    """
+    import asyncio
+
+    def resolve() -> Dict[str, Package]:
+        packages = {package_name: fetch_and_parse_recipe(package_name) for package_name in package_names}
+        return pending_install_plan(resolve_install_plan(packages), logger)
+
+    plan = await asyncio.to_thread(resolve)
+    try:
+        await async_execute_install_plan(plan, logger, jobs)
+    finally:
+        await asyncio.to_thread(mark_explicit_packages, package_names)
+
+
+def sync_mirror(package_names: List[str], mirror_dir: str, logger: logging.Logger, jobs: int = 1) -> None:
+    """
+    Populates a mirror directory that settings.mirror can point at, either directly or through any HTTP
+    server serving it. The recipes of the given packages and of their dependencies are written to the
+    "recipes" directory together with a recipe index, and the artifacts of vendor_install packages are
+    downloaded into the "artifacts" directory under the names given by mirror_artifact_name, followed by
+    the suffix of the download. Their file names are listed in the recipes directory, see
+    load_mirror_artifacts. Artifacts named by their checksum are only downloaded once; the others are
+    refreshed on every sync.
+
+    Arguments:
+        package_names (List[str]): The names of the packages to mirror. Every package of the recipe
+            index is mirrored if the list is empty.
+        mirror_dir (str): The mirror directory.
+        logger (logging.Logger): A logger instance for logging messages during the synchronization.
+        jobs (int): The maximum number of artifacts to download concurrently.
+
+    Raises:
+        ValueError: If no package names are given and no recipe index is available.
+    """
+    import uuid
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not package_names:
+        index = load_recipe_index()
+        if index is None:
+            raise ValueError("No package names given and no recipe index available to mirror")
+        package_names = list(index)
+
+    plan = resolve_install_plan({package_name: fetch_and_parse_recipe(package_name) for package_name in package_names})
+
+    recipes_dir = os.path.join(mirror_dir, "recipes")
+    artifacts_dir = os.path.join(mirror_dir, "artifacts")
+    os.makedirs(recipes_dir, exist_ok=True)
+    os.makedirs(artifacts_dir, exist_ok=True)
+    for name, package in plan.items():
+        with open(os.path.join(recipes_dir, f"{name}.json"), "w") as file:
+            json.dump(recipe_data(package), file, indent=2)
+            file.write("\n")
+    index = write_recipe_index(recipes_dir)
+    logger.info(f"Mirrored {len(plan)} recipes (index version {index['version']})")
+
+    artifacts_file = os.path.join(recipes_dir, mirror_artifacts_name)
+    artifact_files = read_json_file(artifacts_file) or {}
+
+    def mirror_artifact(package: Package) -> None:
+        artifact_name = mirror_artifact_name(package)
+        previous_file = artifact_files.get(artifact_name, artifact_name)
+        if package.checksum and os.path.exists(os.path.join(artifacts_dir, previous_file)):
+            logger.info(f"Package '{package.name}' is already mirrored")
+            return
+        package_file = download_artifact(package, logger)
+        artifact_file = artifact_name + archive_suffix(package_file)
+        staged_file = os.path.join(artifacts_dir, f".{uuid.uuid4().hex}.tmp")
+        shutil.move(package_file, staged_file)
+        os.replace(staged_file, os.path.join(artifacts_dir, artifact_file))
+        if previous_file != artifact_file:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(artifacts_dir, previous_file))
+        artifact_files[artifact_name] = artifact_file
+        logger.info(f"Mirrored package '{package.name}'")
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            packages = [package for package in plan.values() if package.strategy == "vendor_install"]
+            for future in [executor.submit(mirror_artifact, package) for package in packages]:
+                future.result()
+    finally:
+        write_json_file(artifacts_file, artifact_files)
+
+
+def load_manifest(manifest_file: str) -> List[str]:
+    """
+    Reads the package names listed in a manifest file. A manifest is a JSON file containing either a
+    list of package names or an object whose "packages" member is such a list.
+
+    Arguments:
+        manifest_file (str): The path of the manifest file.
+
+    Returns:
+        List[str]: The package names listed in the manifest.
+
+    Raises:
+        ValueError: If the manifest is not valid.
+    """
+    with open(manifest_file) as file:
+        manifest = json.load(file)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("packages")
+    if not isinstance(manifest, list) or not all(isinstance(name, str) for name in manifest):
+        raise ValueError(f"Manifest '{manifest_file}' must be a list of package names")
+    return manifest
+
+
+def main() -> None:
+    """
+    The entry point of the script. This function parses the command-line arguments, collects the
+    requested package names, configures the logger, and performs the install or uninstall action
+    for all of them as requested.
+    """
+    args = parse_arguments()
+    settings.cache_dir = args.cache_dir
+    settings.recipe_ttl = args.recipe_ttl
+    settings.artifact_cache_size = args.artifact_cache_size * 1024 ** 2
+    settings.download_segments = args.segments
+    settings.http_pool_size = args.pool_size
+    settings.http_retries = args.retries
+    settings.http_backoff = args.retry_backoff
+    settings.chunk_size = args.chunk_size * 1024
+    settings.extract_workers = args.extract_jobs
+    settings.use_recipe_index = args.use_recipe_index
+    settings.mirror = args.mirror
+    settings.state_db = args.state_db
+    settings.force = args.force
+    package_names = list(args.package_names)
+    for manifest_file in args.manifest:
+        package_names.extend(load_manifest(manifest_file))
+    package_names, action = list(dict.fromkeys(package_names)), args.action
+
+    logger = configure_logger(package_names[0] if len(package_names) == 1 else "rootbeer")
+
+    if action == "index" and args.check:
+        if not recipe_index_is_current(args.recipes_dir):
+            logger.error(f"The index of '{args.recipes_dir}' is out of date, run the index action to rebuild it")
+            sys.exit(1)
+        logger.info(f"The index of '{args.recipes_dir}' is up to date")
+    elif action == "index":
+        index = write_recipe_index(args.recipes_dir)
+        logger.info(f"Wrote {len(index['recipes'])} recipes to the index of '{args.recipes_dir}' "
+                    f"(version {index['version']})")
+    elif action == "mirror":
+        sync_mirror(package_names, args.mirror_dest, logger, jobs=args.jobs)
+    elif action == "install":
+        if args.use_async:
+            import asyncio
+            asyncio.run(async_install_packages(package_names, logger, jobs=args.jobs))
+        else:
+            install_packages(package_names, logger, jobs=args.jobs)
+    elif action == "upgrade":
+        upgrade_packages([] if args.upgrade_all else package_names, logger, jobs=args.jobs)
+    elif action == "sync":
+        sync_packages(package_names, logger, jobs=args.jobs)
+    elif action == "uninstall":
+        uninstall_packages(package_names, logger, jobs=args.jobs, cascade=args.cascade)
     else:
         raise ValueError("Unsupported action")
 